@@ -1,37 +1,158 @@
 import os
 import json
+import threading
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
-from langchain.agents import Tool, AgentExecutor, initialize_agent, AgentType
+from langchain.agents import Tool, AgentExecutor, BaseSingleActionAgent, initialize_agent, AgentType
 from langchain.memory import ConversationBufferWindowMemory
 from langchain.schema import BaseMessage
 from langchain_openai import ChatOpenAI
 from langchain.callbacks import StreamlitCallbackHandler
 
 from tools.search_tool import WebSearchTool
+from tools.web_reader import WebPageReader, WebReaderTool
 from tools.doc_reader import DocumentReaderTool
 from tools.todo_tool import TodoTool
 from tools.calculator_tool import CalculatorTool
+from tools.calculator_worker import IsolatedEvaluator
 from memory.memory_manager import EnhancedMemoryManager
+from memory.shard_store import get_memory_store
+from memory.answer_cache import CACHEABLE_TOOLS, SemanticAnswerCache, ToolUsageTracker
 
 
 load_dotenv()
 
-class PersonalAIAgent:
+class SessionBusyError(RuntimeError):
+    """
+    Un tour est déjà en cours pour cette session (appel non bloquant)
+    """
+
+
+class SharedAgentResources:
     def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7):
         """
-        Agent IA personnel multitâche
+        Ressources coûteuses partagées par toutes les sessions : client LLM, outils sans état
+        (recherche web, lecteur de PDF et son cache d'index, calculatrice),
+        stockage de la mémoire et agent ReAct (prompt + chaîne LLM)
         """
+        # Streaming activé : les jetons sont transmis aux callbacks (Streamlit, /ask/stream) dès leur génération
         self.llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            streaming=True
+        )
+        # Vide : Serper n'est interrogé qu'après l'échec de DuckDuckGo
+        hedge_after = os.getenv("WEB_SEARCH_HEDGE_AFTER", "1.0")
+        self.web_search = WebSearchTool(
+            cache_ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600")),
+            cache_file=os.getenv("WEB_SEARCH_CACHE_FILE") or None,
+            requests_per_second=float(os.getenv("WEB_SEARCH_RATE_LIMIT", "0.67")),
+            burst=int(os.getenv("WEB_SEARCH_BURST", "3")),
+            timeout=float(os.getenv("WEB_SEARCH_TIMEOUT", "5")),
+            hedge_after=float(hedge_after) if hedge_after else None,
+            ddg_endpoint=os.getenv("DDG_HTML_URL") or None,
+            serper_endpoint=os.getenv("SERPER_URL") or "https://google.serper.dev/search"
+        )
+        # Lecture des pages de résultats : téléchargements parallèles bornés, index éphémère
+        self.web_reader = WebReaderTool(
+            self.web_search,
+            reader=WebPageReader(
+                timeout=float(os.getenv("WEB_READ_TIMEOUT", "8")),
+                max_bytes=int(os.getenv("WEB_READ_MAX_BYTES", "1000000")),
+                max_connections=int(os.getenv("WEB_READ_MAX_CONNECTIONS", "10")),
+                per_host=int(os.getenv("WEB_READ_PER_HOST", "2"))
+            ),
+            top_n=int(os.getenv("WEB_READ_TOP_N", "5"))
+        )
+        self.doc_reader = DocumentReaderTool()
+        # Calculs lourds (grandes puissances) dans un processus séparé, temps CPU et mémoire plafonnés
+        self.calculator = CalculatorTool(isolated=IsolatedEvaluator(
+            cpu_seconds=float(os.getenv("CALCULATOR_CPU_SECONDS", "2")),
+            memory_mb=float(os.getenv("CALCULATOR_MEMORY_MB", "256")),
+            timeout=float(os.getenv("CALCULATOR_TIMEOUT", "5"))
+        ))
+        # Mémoire partitionnée par session, commune à tous les agents (un stockage par dossier dans le processus)
+        self.memory_store = get_memory_store(
+            store_dir=os.getenv("MEMORY_STORE_DIR", "conversation_memory_store"),
+            max_loaded_shards=int(os.getenv("MEMORY_HOT_SHARDS", "8")),
+            max_hot_messages=int(os.getenv("MEMORY_HOT_MESSAGES", "20000")),
+            weak_match_distance=float(os.getenv("MEMORY_WEAK_MATCH_DISTANCE", "0.5")),
+            legacy_log_file="conversation_memory.jsonl",
+            legacy_file="conversation_memory.json"
         )
+        # Cache sémantique des réponses (désactivable)
+        self.answer_cache = SemanticAnswerCache(
+            self.memory_store.embeddings,
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+        ) if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes") else None
+        self._agent = None
+        self._agent_lock = threading.Lock()
+
+    def get_agent(self, build) -> BaseSingleActionAgent:
+        """
+        Retourne l'agent ReAct partagé, construit au premier appel.
+        Les sessions n'en diffèrent que par leurs outils (mêmes noms) et leur mémoire.
+        """
+        with self._agent_lock:
+            if self._agent is None:
+                self._agent = build()
+            return self._agent
+
+    def close(self):
+        """
+        Termine l'indexation de la mémoire en attente et sauvegarde les index,
+        arrête le processus de calcul
+        """
+        self.memory_store.close()
+        self.calculator.close()
+
+
+_shared_resources: Dict[tuple, SharedAgentResources] = {}
+_shared_resources_lock = threading.Lock()
+
+
+def get_shared_resources(model_name: str = "gpt-3.5-turbo", temperature: float = 0.7) -> SharedAgentResources:
+    """
+    Retourne les ressources partagées du processus pour ce modèle et cette température :
+    chaque session Streamlit ou API réutilise le même client LLM, les mêmes outils et le même stockage
+    """
+    key = (model_name, temperature)
+    with _shared_resources_lock:
+        if key not in _shared_resources:
+            _shared_resources[key] = SharedAgentResources(model_name=model_name, temperature=temperature)
+        return _shared_resources[key]
+
+
+class PersonalAIAgent:
+    def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7,
+                 session_id: Optional[str] = None, resources: Optional[SharedAgentResources] = None):
+        """
+        Agent IA personnel multitâche.
+        Avec session_id, la mémoire et les tâches sont propres à la session ;
+        Sans resources, les ressources coûteuses partagées du processus sont utilisées (get_shared_resources).
+        """
+        self.resources = resources or get_shared_resources(model_name=model_name, temperature=temperature)
+        self.llm = self.resources.llm
+        self.session_id = session_id
+        # Un seul tour à la fois par session (la mémoire de conversation n'est pas partagée)
+        self._chat_lock = threading.Lock()
+        # Empreinte du dernier document lu dans la session (contexte du cache des réponses)
+        self._current_document: Optional[str] = None
         
-        # Gestionnaire de mémoire amélioré
-        self.memory_manager = EnhancedMemoryManager()
+        # Gestionnaire de mémoire amélioré (partition de la session dans le stockage partagé)
+        self.memory_manager = EnhancedMemoryManager(
+            session_id=session_id,
+            store=self.resources.memory_store
+        )
+
+        # Liste de tâches propre à la session
+        self.todo_manager = (TodoTool(storage_file=TodoTool.session_file(session_id), scope=session_id)
+                             if session_id else TodoTool())
         
         # Mémoire conversationnelle
         self.memory = ConversationBufferWindowMemory(
@@ -39,6 +160,13 @@ class PersonalAIAgent:
             return_messages=True,
             k=10  # Garde les 10 derniers échanges
         )
+        if session_id:
+            # Session recréée après expiration : reprise des derniers échanges enregistrés
+            for message in self.memory_manager.get_recent_messages(20):
+                if message["role"] == "user":
+                    self.memory.chat_memory.add_user_message(message["content"])
+                else:
+                    self.memory.chat_memory.add_ai_message(message["content"])
         
         # Initialisation des outils
         self.tools = self._initialize_tools()
@@ -50,10 +178,10 @@ class PersonalAIAgent:
         """
         Initialise tous les outils disponibles pour l'agent
         """
-        web_search = WebSearchTool()
-        doc_reader = DocumentReaderTool()
-        todo_manager = TodoTool()
-        calculator = CalculatorTool()
+        web_search = self.resources.web_search
+        doc_reader = self.resources.doc_reader
+        todo_manager = self.todo_manager
+        calculator = self.resources.calculator
         
         tools = [
             Tool(
@@ -61,6 +189,11 @@ class PersonalAIAgent:
                 description="Recherche d'informations sur internet. Utilise ce tool quand l'utilisateur demande des informations actuelles, des données spécifiques, ou des recherches web.",
                 func=web_search.search
             ),
+            Tool(
+                name="web_reader",
+                description="Recherche sur internet puis lit le contenu des meilleures pages et en extrait les passages pertinents. Utilise ce tool quand les titres et extraits de web_search ne suffisent pas pour répondre précisément.",
+                func=self.resources.web_reader.read
+            ),
             Tool(
                 name="document_reader",
                 description="Lit et analyse des documents PDF. Utilise ce tool quand l'utilisateur mentionne un fichier PDF ou demande des informations sur un document.",
@@ -68,17 +201,17 @@ class PersonalAIAgent:
             ),
             Tool(
                 name="todo_manager",
-                description="Gère une liste de tâches (TODO). Utilise ce tool pour ajouter, lister, marquer comme terminé ou supprimer des tâches.",
+                description="Gère une liste de tâches (TODO). Utilise ce tool pour ajouter, lister, marquer comme terminé ou supprimer des tâches. Commandes : add:tâche, list, done:ID, remove:ID, count. list et count acceptent des filtres, ex. list:status=open limit=10 (10 tâches ouvertes les plus récentes), list:text=rapport since=2025-01-01 until=2025-01-31 page=2, count:status=done. Préfère count ou des filtres à une liste complète.",
                 func=todo_manager.manage_todo
             ),
             Tool(
                 name="calculator",
-                description="Effectue des calculs mathématiques simples ou complexes. Utilise ce tool pour tous types de calculs numériques.",
+                description="Effectue des calculs mathématiques simples ou complexes. Utilise ce tool pour tous types de calculs numériques. Variables possibles après un point-virgule, ex. : x**2 + y ; x=3, y=4. Pour un tableau de valeurs, un seul appel avec une liste ou un intervalle : 1000*(1+r)^n ; r=0.05, n=1..40 ou sin(x) ; x=0..2*pi:10000",
                 func=calculator.calculate
             ),
             Tool(
                 name="memory_search",
-                description="Recherche dans l'historique des conversations précédentes. Utilise ce tool quand l'utilisateur fait référence à quelque chose mentionné précédemment.",
+                description="Recherche dans l'historique des conversations précédentes. Utilise ce tool quand l'utilisateur fait référence à quelque chose mentionné précédemment. Filtres optionnels dans la requête : role:user|assistant, session:current|AAAAMMJJ_HH, since:AAAA-MM-JJ, until:AAAA-MM-JJ.",
                 func=self.memory_manager.search_memory
             )
         ]
@@ -119,42 +252,107 @@ Exemples :
 """
 
 
-        agent = initialize_agent(
+        # Prompt et chaîne LLM construits une seule fois, partagés par toutes les sessions
+        shared_agent = self.resources.get_agent(lambda: initialize_agent(
             tools=self.tools,
             llm=self.llm,
             agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-            memory=self.memory,
             verbose=True,
             handle_parsing_errors=True,
             agent_kwargs={
                 "system_message": system_message
             }
+        ).agent)
+
+        # Exécuteur propre à la session : ses outils et sa mémoire de conversation
+        agent = AgentExecutor.from_agent_and_tools(
+            agent=shared_agent,
+            tools=self.tools,
+            memory=self.memory,
+            verbose=True,
+            handle_parsing_errors=True
         )
         
         return agent
     
-    def chat(self, message: str, callback_handler=None) -> str:
+    def chat(self, message: str, callback_handler=None, raise_errors: bool = False,
+             blocking: bool = True) -> str:
         """
-        Interface principale pour discuter avec l'agent
+        Interface principale pour discuter avec l'agent.
+        Avec raise_errors=True, une erreur est propagée au lieu d'être renvoyée comme réponse.
+        Avec blocking=False, SessionBusyError est levée si un tour est déjà en cours pour la session.
         """
+        if not self._chat_lock.acquire(blocking=blocking):
+            raise SessionBusyError("un tour est déjà en cours pour cette session")
+        try:
+            return self._chat(message, callback_handler, raise_errors)
+        finally:
+            self._chat_lock.release()
+
+    def is_busy(self) -> bool:
+        """
+        Indique si un tour est en cours pour la session
+        """
+        return self._chat_lock.locked()
+
+    def _chat(self, message: str, callback_handler=None, raise_errors: bool = False) -> str:
         try:
             # Sauvegarde du message utilisateur
             self.memory_manager.add_message("user", message)
-            
+
+            # Réponse déjà calculée pour une question proche dans le même contexte
+            cache = self.resources.answer_cache
+            if cache is not None:
+                # Version lue dans le stockage des tâches : une modification faite par un autre processus
+                # rend aussi les réponses précédentes inaccessibles
+                todo_version = self.todo_manager.version
+                document_hash, question = self.resources.doc_reader.resolve_document(message)
+                # Sans "file:", la question porte sur le dernier document lu dans la session ;
+                # les réponses indépendantes de tout document sont rangées sous None
+                document_hash = document_hash or self._current_document
+                contexts = [(self._cache_session(), document_hash, todo_version)]
+                if document_hash is not None:
+                    contexts.append((self._cache_session(), None, todo_version))
+                # Sans réponse candidate dans ces contextes, la question n'est pas vectorisée
+                cached, vector = cache.lookup(question, contexts)
+                if cached is not None:
+                    self.memory.save_context({"input": message}, {"output": cached})
+                    self.memory_manager.add_message("assistant", cached)
+                    return cached
+
             # Traitement par l'agent
-            if callback_handler:
-                response = self.agent.run(input=message, callbacks=[callback_handler])
-            else:
-                response = self.agent.run(input=message)
+            tracker = ToolUsageTracker()
+            callbacks = [callback_handler, tracker] if callback_handler else [tracker]
+            response = self.agent.run(input=message, callbacks=callbacks)
             
             # Sauvegarde de la réponse
             self.memory_manager.add_message("assistant", response)
+
+            # Documents réellement lus pendant le tour (entrées de document_reader)
+            read_documents = {
+                self.resources.doc_reader.resolve_document(tool_input)[0]
+                for tool, tool_input in tracker.inputs if tool == "document_reader"
+            }
+            if len(read_documents) == 1 and None not in read_documents:
+                self._current_document = next(iter(read_documents))
+
+            if cache is not None:
+                if self.todo_manager.version != todo_version:
+                    cache.invalidate(self._cache_session())
+                # Seules les réponses issues d'outils indépendants de l'historique sont réutilisables,
+                # rangées sous le document effectivement lu (un seul, identifié)
+                elif (tracker.tools and tracker.tools <= CACHEABLE_TOOLS
+                      and len(read_documents) <= 1 and None not in read_documents):
+                    context = (self._cache_session(), next(iter(read_documents), None), todo_version)
+                    cache.store(question, context, response, vector)
             
             return response
             
         except Exception as e:
             error_msg = f"Désolé, j'ai rencontré une erreur : {str(e)}"
             self.memory_manager.add_message("assistant", error_msg)
+            if raise_errors:
+                raise
             return error_msg
     
     def get_conversation_history(self) -> List[Dict]:
@@ -162,10 +360,36 @@ Exemples :
         Récupère l'historique de conversation
         """
         return self.memory_manager.get_recent_messages()
+
+    def discard(self):
+        """
+        Supprime l'historique et les tâches de la session (agent éphémère)
+        """
+        self.clear_memory()
+        if self.session_id:
+            self.todo_manager.delete_storage()
+
+    def _cache_session(self) -> str:
+        return self.session_id or "local"
+
+    def get_cache_stats(self) -> Dict:
+        """
+        Statistiques du cache de réponses (taux de succès, entrées)
+        """
+        cache = self.resources.answer_cache
+        return cache.get_stats() if cache is not None else {}
+
+    def get_memory_stats(self) -> Dict:
+        """
+        Statistiques de la mémoire (tiers chaud et froid)
+        """
+        return self.memory_manager.get_stats()
     
     def clear_memory(self):
         """
-        Efface la mémoire conversationnelle
+        Efface la mémoire conversationnelle (et les réponses en cache de la session)
         """
         self.memory.clear()
-        self.memory_manager.clear_memory()
\ No newline at end of file
+        self.memory_manager.clear_memory()
+        if self.resources.answer_cache is not None:
+            self.resources.answer_cache.invalidate(self._cache_session())
\ No newline at end of file
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from agent import PersonalAIAgent, SharedAgentResources, get_shared_resources
+
+
+class AgentSessionPool:
+    def __init__(self, resources: Optional[SharedAgentResources] = None, max_sessions: int = 10000,
+                 ttl_seconds: float = 3600):
+        """
+        Agents par appelant : mémoire de conversation, partition mémoire et tâches isolées par session,
+        ressources coûteuses (LLM, embeddings, recherche web, index des PDF) partagées.
+        Les sessions inactives depuis ttl_seconds, ou les moins récentes au-delà de max_sessions, sont libérées ;
+        une session dont un tour est en cours (run, ou verrou de conversation pris) n'est jamais libérée.
+        """
+        self.resources = resources or get_shared_resources()
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, PersonalAIAgent]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Tours en cours par session (run) : la session reste dans le pool jusqu'à leur fin
+        self._in_use: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "expired": 0, "evicted": 0}
+
+    def get(self, session_id: str, pin: bool = False) -> PersonalAIAgent:
+        """
+        Retourne l'agent de la session, créé à la demande.
+        Avec pin=True, la session est marquée en cours d'utilisation (libérée par unpin).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            agent = self._sessions.get(session_id)
+            if agent is not None:
+                self._sessions.move_to_end(session_id)
+                self._last_used[session_id] = now
+                self.stats["reused"] += 1
+                if pin:
+                    self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+                return agent
+
+        # Construction hors verrou : seuls la mémoire, les tâches et l'exécuteur sont créés
+        agent = PersonalAIAgent(session_id=session_id, resources=self.resources)
+
+        with self._lock:
+            existing = self._sessions.get(session_id)
+            if existing is not None:
+                # Créée entre-temps par une requête concurrente
+                self._sessions.move_to_end(session_id)
+                agent = existing
+            else:
+                self._sessions[session_id] = agent
+                self._last_used[session_id] = time.monotonic()
+                self.stats["created"] += 1
+            if pin:
+                self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+            # Les moins récentes d'abord, en sautant celles dont un tour est en cours
+            overflow = len(self._sessions) - self.max_sessions
+            evictable = [sid for sid in self._sessions if sid != session_id and not self._is_busy(sid)]
+            for oldest in evictable[:max(0, overflow)]:
+                self._release(oldest)
+                self.stats["evicted"] += 1
+        return agent
+
+    def unpin(self, session_id: str):
+        with self._lock:
+            count = self._in_use.get(session_id, 0) - 1
+            if count > 0:
+                self._in_use[session_id] = count
+            else:
+                self._in_use.pop(session_id, None)
+
+    def run(self, session_id: str, question: str, **chat_kwargs) -> str:
+        """
+        Exécute un tour dans la session ; la session ne peut pas être libérée pendant le tour
+        """
+        agent = self.get(session_id, pin=True)
+        try:
+            return agent.chat(question, **chat_kwargs)
+        finally:
+            self.unpin(session_id)
+
+    def _is_busy(self, session_id: str) -> bool:
+        return session_id in self._in_use or self._sessions[session_id].is_busy()
+
+    def _release(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
+    def peek(self, session_id: str) -> Optional[PersonalAIAgent]:
+        """
+        Retourne l'agent de la session s'il existe déjà, sans le créer
+        """
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def _evict_expired(self, now: float):
+        # Les sessions sont ordonnées par dernière utilisation : on s'arrête à la première encore active
+        expired = []
+        for session_id in self._sessions:
+            if now - self._last_used[session_id] < self.ttl_seconds:
+                break
+            if not self._is_busy(session_id):
+                expired.append(session_id)
+        for session_id in expired:
+            self._release(session_id)
+            self.stats["expired"] += 1
+
+    def run_isolated(self, session_id: str, question: str, callback_handler=None) -> str:
+        """
+        Exécute une question dans une session éphémère (hors pool), effacée ensuite.
+        Les erreurs sont propagées.
+        """
+        agent = PersonalAIAgent(session_id=session_id, resources=self.resources)
+        try:
+            return agent.chat(question, callback_handler=callback_handler, raise_errors=True)
+        finally:
+            agent.discard()
+
+    def remove(self, session_id: str) -> bool:
+        """
+        Libère une session (son historique reste sur disque)
+        """
+        with self._lock:
+            self._last_used.pop(session_id, None)
+            return self._sessions.pop(session_id, None) is not None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            stats = dict(self.stats)
+            stats["active_sessions"] = len(self._sessions)
+            stats["max_sessions"] = self.max_sessions
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+            self._last_used.clear()
+        self.resources.close()
@@ -1,11 +1,18 @@
 from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Dict
-from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Optional
+from pydantic import BaseModel, Field
+import asyncio
+import json
 import os
+import time
+import uuid
 from dotenv import load_dotenv
-from agent import PersonalAIAgent
+from agent import SessionBusyError
+from agent_pool import AgentSessionPool
+from utils.bounded_executor import BoundedExecutor, QueueFullError, QueueTimeoutError
+from utils.stream_handler import AgentEventStreamHandler
 
 # === Chargement des variables d'environnement
 load_dotenv()
@@ -19,12 +26,84 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# === Chargement de l'agent IA
-agent = PersonalAIAgent()
+# === Agents par appelant (ressources coûteuses partagées)
+pool = AgentSessionPool(
+    max_sessions=int(os.getenv("API_MAX_SESSIONS", "10000")),
+    ttl_seconds=float(os.getenv("API_SESSION_TTL", "3600"))
+)
+
+# === Pool borné : les tours de l'agent (bloquants) ne s'exécutent pas dans la boucle d'événements
+executor = BoundedExecutor(
+    max_workers=int(os.getenv("API_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("API_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+)
+
+# === Pool dédié aux lots : un lot volumineux ne prive pas /ask de ses workers
+batch_executor = BoundedExecutor(
+    max_workers=int(os.getenv("API_BATCH_MAX_WORKERS", "8")),
+    max_queue=int(os.getenv("API_BATCH_MAX_QUEUE", "1000")),
+    queue_timeout=None,
+    name="batch-worker"
+)
+BATCH_MAX_ITEMS = int(os.getenv("API_BATCH_MAX_ITEMS", "200"))
+BATCH_DEFAULT_PARALLELISM = int(os.getenv("API_BATCH_PARALLELISM", "8"))
 
 # === Schéma d'entrée pour /ask
 class AskInput(BaseModel):
     question: str
+    # Identifiant de l'appelant : historique et tâches isolés par session.
+    # Sans identifiant, la question est traitée dans une session éphémère (aucun historique partagé)
+    session_id: Optional[str] = Field(default=None, max_length=128, pattern=r"^[\w.-]+$")
+
+# === Schéma d'entrée pour /ask/batch
+class BatchInput(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    # Nombre de questions traitées simultanément pour ce lot
+    parallelism: Optional[int] = Field(default=None, ge=1)
+    # Résultats renvoyés au fil de l'eau (une ligne JSON par question terminée)
+    stream: bool = False
+
+def _chat(session_id: Optional[str], question: str, callback_handler=None) -> str:
+    if session_id is None:
+        return pool.run_isolated(f"anon-{uuid.uuid4().hex[:12]}", question, callback_handler)
+    # Un tour déjà en cours pour la session : refus immédiat plutôt que d'occuper un worker en attente
+    return pool.run(f"api-{session_id}", question, callback_handler=callback_handler, blocking=False)
+
+def _session_busy(session_id: Optional[str]) -> bool:
+    agent = pool.peek(f"api-{session_id}") if session_id is not None else None
+    return agent is not None and agent.is_busy()
+
+def _check_token(credentials: HTTPAuthorizationCredentials):
+    if credentials.scheme != "Bearer" or credentials.credentials != API_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+def _overload_response(error: Exception) -> JSONResponse:
+    """
+    File pleine ou session occupée : 429 immédiat ; attente en file trop longue : 503
+    """
+    overloaded = isinstance(error, (QueueFullError, SessionBusyError))
+    return JSONResponse(
+        status_code=429 if overloaded else 503,
+        content={"error": str(error), "queue_depth": executor.queue_depth()},
+        headers={"Retry-After": "1" if overloaded else "5"}
+    )
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.on_event("shutdown")
+def shutdown():
+    executor.shutdown(wait=False)
+    batch_executor.shutdown(wait=False)
+    pool.close()
+
+# === Santé du service (non authentifié, ne passe pas par la file)
+@app.get("/health")
+async def health() -> Dict:
+    return {"status": "ok", "queue": executor.get_stats(), "batch_queue": batch_executor.get_stats(),
+            "sessions": pool.get_stats(),
+            "answer_cache": pool.resources.answer_cache.get_stats() if pool.resources.answer_cache else None}
 
 # === Endpoint sécurisé
 @app.post("/ask")
@@ -32,11 +111,116 @@ async def ask(
     data: AskInput,
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
 ):
-    if credentials.scheme != "Bearer" or credentials.credentials != API_TOKEN:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    _check_token(credentials)
 
     try:
-        response = agent.chat(data.question)
-        return {"answer": response}
+        # La création éventuelle de la session (lecture disque) se fait aussi hors de la boucle
+        response, wait = await executor.run(_chat, data.session_id, data.question)
+        return JSONResponse(
+            content={"answer": response, "queue_wait_ms": round(wait * 1000, 1)},
+            headers={"X-Queue-Wait-Ms": f"{wait * 1000:.1f}"}
+        )
+    except (QueueFullError, QueueTimeoutError, SessionBusyError) as e:
+        # Refus immédiat plutôt que de ralentir toutes les requêtes
+        return _overload_response(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+# === Endpoint en flux (Server-Sent Events) : étapes de l'agent puis jetons de la réponse
+@app.post("/ask/stream")
+async def ask_stream(
+    data: AskInput,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    _check_token(credentials)
+    # Le flux démarre dès la soumission : une session occupée est refusée avant
+    if _session_busy(data.session_id):
+        return _overload_response(SessionBusyError("un tour est déjà en cours pour cette session"))
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    # Les callbacks s'exécutent dans le thread de l'agent : passage à la boucle via call_soon_threadsafe
+    handler = AgentEventStreamHandler(lambda event, payload: loop.call_soon_threadsafe(
+        events.put_nowait, (event, payload)
+    ))
+
+    try:
+        turn = executor.submit(_chat, data.session_id, data.question, handler)
+    except QueueFullError as e:
+        return _overload_response(e)
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse("queued", {"queue_depth": executor.queue_depth()})
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({next_event, turn}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                yield _sse(*next_event.result())
+                continue
+
+            next_event.cancel()
+            # Événements émis juste avant la fin du tour
+            while not events.empty():
+                yield _sse(*events.get_nowait())
+            try:
+                response, wait = turn.result()
+                yield _sse("done", {"answer": response, "queue_wait_ms": round(wait * 1000, 1)})
+            except Exception as e:
+                yield _sse("error", {"error": str(e)})
+            return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# === Lot de questions : exécution parallèle bornée, mémoire isolée par question
+@app.post("/ask/batch")
+async def ask_batch(
+    data: BatchInput,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    _check_token(credentials)
+
+    batch_id = uuid.uuid4().hex[:12]
+    parallelism = min(data.parallelism or BATCH_DEFAULT_PARALLELISM, batch_executor.max_workers)
+    semaphore = asyncio.Semaphore(parallelism)
+    started = time.monotonic()
+
+    async def run_item(index: int, question: str) -> Dict:
+        async with semaphore:
+            item_start = time.monotonic()
+            result = {"index": index, "question": question, "answer": None, "error": None}
+            try:
+                answer, wait = await batch_executor.run(
+                    pool.run_isolated, f"batch-{batch_id}-{index}", question
+                )
+                result["answer"] = answer
+                result["queue_wait_ms"] = round(wait * 1000, 1)
+            except Exception as e:
+                result["error"] = str(e)
+            result["latency_ms"] = round((time.monotonic() - item_start) * 1000, 1)
+            return result
+
+    tasks = [asyncio.ensure_future(run_item(i, q)) for i, q in enumerate(data.questions)]
+
+    if not data.stream:
+        results = await asyncio.gather(*tasks)
+        return {
+            "batch_id": batch_id,
+            "results": results,
+            "errors": sum(1 for r in results if r["error"]),
+            "total_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    async def result_stream() -> AsyncIterator[str]:
+        # Ordre d'achèvement ; le champ index permet de remettre les résultats dans l'ordre
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
@@ -6,7 +6,7 @@ from pathlib import Path
 
 import streamlit as st
 
-from agent import PersonalAIAgent
+from agent import PersonalAIAgent, get_shared_resources
 
 from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
 
@@ -22,7 +22,8 @@ st.title("🤖 Agent IA Personnel")
 
 if "agent" not in st.session_state:
 
-    st.session_state.agent = PersonalAIAgent()
+    # Ressources coûteuses (LLM, outils, stockage) communes à toutes les sessions Streamlit
+    st.session_state.agent = PersonalAIAgent(resources=get_shared_resources())
 
     st.session_state.messages = []
 
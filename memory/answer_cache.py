@@ -0,0 +1,150 @@
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain.callbacks.base import BaseCallbackHandler
+
+# Outils dont le résultat ne dépend pas de l'historique ni des tâches : réponses réutilisables.
+# La calculatrice en est exclue : "1234*5678" et "1234*5679" ont des embeddings quasi identiques.
+CACHEABLE_TOOLS = {"document_reader", "web_search", "web_reader"}
+# Éléments qui doivent être identiques pour réutiliser une réponse : nombres et passages entre guillemets
+EXACT_TOKEN_PATTERN = re.compile(r'\d+(?:[.,]\d+)*|"[^"]*"|«[^»]*»|“[^”]*”')
+
+
+def exact_tokens(question: str) -> Tuple[str, ...]:
+    return tuple(token.strip('"«»“” ').lower() for token in EXACT_TOKEN_PATTERN.findall(question))
+
+
+class ToolUsageTracker(BaseCallbackHandler):
+    def __init__(self):
+        """
+        Relève les outils appelés pendant un tour de l'agent (et leurs entrées)
+        """
+        self.tools: Set[str] = set()
+        self.inputs: List[Tuple[str, str]] = []
+
+    def on_agent_action(self, action, **kwargs: Any):
+        self.tools.add(action.tool)
+        self.inputs.append((action.tool, str(action.tool_input)))
+
+
+class SemanticAnswerCache:
+    def __init__(self, embeddings, similarity_threshold: float = 0.95, ttl_seconds: float = 3600,
+                 max_entries: int = 1000):
+        """
+        Cache sémantique des réponses : une question proche (similarité cosinus >= seuil)
+        d'une question déjà traitée dans le même contexte (session, document, version des tâches)
+        réutilise sa réponse,
+        à condition que ses nombres et passages entre guillemets soient identiques.
+        Entrées expirées après ttl_seconds, éviction LRU au-delà de max_entries.
+        """
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._by_context: Dict[Tuple, Set[int]] = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question: str, contexts: Sequence[Tuple]) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Cherche une réponse pour une question proche dans l'un des contextes, dans l'ordre.
+        Retourne (réponse ou None, vecteur de la question réutilisable pour store, ou None
+        si aucune réponse candidate n'existait : la question n'est alors pas vectorisée).
+        """
+        tokens = exact_tokens(question)
+        with self._lock:
+            candidates = any(
+                self._entries[entry_id]["tokens"] == tokens
+                for context in contexts
+                for entry_id in self._by_context.get(context, ())
+            )
+            if not candidates:
+                self.stats["misses"] += 1
+                return None, None
+
+        vector = self._embed(question)
+        now = time.monotonic()
+        with self._lock:
+            for context in contexts:
+                ids = []
+                for entry_id in list(self._by_context.get(context, ())):
+                    entry = self._entries[entry_id]
+                    if now - entry["created"] > self.ttl_seconds:
+                        self._remove(entry_id)
+                        self.stats["expired"] += 1
+                    elif entry["tokens"] == tokens:
+                        ids.append(entry_id)
+
+                if ids:
+                    similarities = np.vstack([self._entries[i]["vector"] for i in ids]) @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        entry = self._entries[ids[best]]
+                        self._entries.move_to_end(ids[best])
+                        entry["hits"] += 1
+                        self.stats["hits"] += 1
+                        return entry["answer"], vector
+
+            self.stats["misses"] += 1
+            return None, vector
+
+    def store(self, question: str, context: Tuple, answer: str, vector: Optional[np.ndarray] = None):
+        """
+        Enregistre la réponse d'une question dans son contexte
+        """
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "question": question,
+                "context": context,
+                "answer": answer,
+                "vector": vector,
+                "tokens": exact_tokens(question),
+                "created": time.monotonic(),
+                "hits": 0
+            }
+            self._by_context[context].add(entry_id)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evicted"] += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_context[entry["context"]]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_context[entry["context"]]
+
+    def invalidate(self, session_id: Optional[str] = None):
+        """
+        Supprime les réponses d'une session (mémoire effacée, tâches modifiées), ou toutes
+        """
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items()
+                     if session_id is None or entry["context"][0] == session_id]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.stats["invalidated"] += len(stale)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
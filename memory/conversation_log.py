@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows : seul le verrou entre threads s'applique
+    fcntl = None
+
+
+class ConversationLog:
+    def __init__(self, log_file: str = "conversation_memory.jsonl",
+                 legacy_file: Optional[str] = "conversation_memory.json",
+                 fsync: bool = True, compact_every: int = 1000):
+        """
+        Journal append-only des messages (une ligne JSON par message).
+        Chaque ajout est en O(1) ; une écriture interrompue ne corrompt que la dernière ligne,
+        qui est tronquée à l'ouverture suivante. Si des lignes corrompues ont été rencontrées en lecture,
+        le journal est compacté (lignes corrompues retirées) au plus une fois tous les compact_every ajouts.
+        Les écritures prennent un verrou de fichier (<journal>.lock) : plusieurs processus
+        (workers de l'API, sessions Streamlit) peuvent écrire dans le même journal sans doublon de séquence.
+        """
+        self.log_file = log_file
+        self.legacy_file = legacy_file
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._lock_file = self.log_file + ".lock"
+        self._lock_fd = None
+        self._lock_depth = 0
+        self._appends_since_compaction = 0
+        # Offsets des lignes corrompues rencontrées : une ligne relue n'est comptée qu'une fois
+        self._corrupt_offsets = set()
+        self.corrupt_lines = 0
+        self.last_offset = 0
+
+        log_dir = os.path.dirname(self.log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+        with self._exclusive():
+            self._migrate_legacy()
+            self._recover()
+            self._sync_last_seq()
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Verrou d'écriture entre threads et entre processus (réentrant dans un même thread)
+        """
+        with self._lock:
+            if fcntl is not None and self._lock_depth == 0:
+                self._lock_fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_fd is not None and self._lock_depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+
+    def _sync_last_seq(self):
+        """
+        Relit la fin du journal (sous verrou de fichier) : un autre processus a pu y ajouter des messages
+        """
+        last = self.read_tail(1)
+        self.last_seq = last[0]["seq"] if last else 0
+
+    def refresh(self) -> int:
+        """
+        Met à jour last_seq avec les ajouts des autres processus et le retourne
+        """
+        with self._lock:
+            self._sync_last_seq()
+            return self.last_seq
+
+    def _migrate_legacy(self):
+        """
+        Migration unique de l'ancien fichier JSON vers le journal
+        """
+        if os.path.exists(self.log_file) or not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+        except Exception as e:
+            print(f"Ancien fichier mémoire illisible, migration ignorée : {e}")
+            return
+
+        records = [dict(message, seq=seq) for seq, message in enumerate(messages, 1)]
+        self._write_atomic(records)
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+
+    def _recover(self):
+        """
+        Tronque une éventuelle dernière ligne incomplète (crash pendant une écriture)
+        """
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # Recherche du dernier saut de ligne en remontant par blocs
+            position = size
+            while position > 0:
+                block_start = max(0, position - 4096)
+                f.seek(block_start)
+                block = f.read(position - block_start)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    f.truncate(block_start + newline + 1)
+                    break
+                position = block_start
+            else:
+                f.truncate(0)
+
+        print("Journal de conversation : dernière écriture incomplète supprimée.")
+
+    def append(self, message: Dict) -> Dict:
+        """
+        Ajoute un message au journal et retourne l'enregistrement (avec son numéro de séquence)
+        """
+        with self._exclusive():
+            self._sync_last_seq()
+            record = dict(message, seq=self.last_seq + 1)
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with open(self.log_file, "ab") as f:
+                # Position de début de l'enregistrement, utilisée comme point de reprise
+                self.last_offset = f.tell()
+                f.write(line.encode("utf-8"))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.last_seq = record["seq"]
+
+            # Pas de réécriture complète du journal sur le chemin d'une réponse sans ligne corrompue à retirer
+            self._appends_since_compaction += 1
+            if self._corrupt_offsets and self._appends_since_compaction >= self.compact_every:
+                self.compact()
+            return record
+
+    def extend(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Ajoute plusieurs messages en une seule écriture (migration, import)
+        """
+        with self._exclusive():
+            self._sync_last_seq()
+            records = []
+            for message in messages:
+                records.append(dict(message, seq=self.last_seq + len(records) + 1))
+            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            with open(self.log_file, "ab") as f:
+                f.write(data.encode("utf-8"))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            if records:
+                self.last_seq = records[-1]["seq"]
+            return records
+
+    def read_tail(self, n: int) -> List[Dict]:
+        """
+        Lit les n derniers messages sans parcourir tout le journal
+        """
+        if n <= 0 or not os.path.exists(self.log_file):
+            return []
+
+        with self._lock, open(self.log_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b""
+            while position > 0 and data.count(b"\n") <= n:
+                read_size = min(65536, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+
+        lines = []
+        line_offset = position
+        for line in data.split(b"\n"):
+            lines.append((line_offset, line))
+            line_offset += len(line) + 1
+        if position > 0:
+            # La première ligne du bloc peut être partielle
+            lines = lines[1:]
+
+        records = []
+        for line_offset, line in reversed(lines):
+            record = self._parse(line, line_offset)
+            if record is not None:
+                records.append(record)
+                if len(records) == n:
+                    break
+        return list(reversed(records))
+
+    def iter_records(self, after_seq: int = 0, offset: int = 0, with_offset: bool = False) -> Iterator:
+        """
+        Parcourt les messages de numéro de séquence > after_seq, à partir d'un offset en octets.
+        Avec with_offset=True, produit des couples (offset, message).
+        """
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, "rb") as f:
+            f.seek(offset)
+            position = offset
+            for line in f:
+                record = self._parse(line, position)
+                if record is not None and record["seq"] > after_seq:
+                    yield (position, record) if with_offset else record
+                position += len(line)
+
+    def offset_is_valid(self, offset: int, seq: int) -> bool:
+        """
+        Vérifie que l'enregistrement commençant à cet offset porte bien ce numéro de séquence
+        (un compactage peut avoir déplacé les enregistrements)
+        """
+        if not os.path.exists(self.log_file) or offset > self.size_bytes():
+            return False
+        with open(self.log_file, "rb") as f:
+            if offset > 0:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    return False
+            record = self._parse(f.readline(), offset)
+        return record is not None and record["seq"] == seq
+
+    def _parse(self, line: bytes, offset: int) -> Optional[Dict]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+            if "seq" not in record:
+                raise ValueError("numéro de séquence manquant")
+            return record
+        except Exception:
+            if offset not in self._corrupt_offsets:
+                self._corrupt_offsets.add(offset)
+                self.corrupt_lines = len(self._corrupt_offsets)
+            return None
+
+    def compact(self):
+        """
+        Réécrit le journal sans les lignes corrompues (écriture atomique)
+        """
+        with self._exclusive():
+            records = list(self.iter_records())
+            self._write_atomic(records)
+            self._corrupt_offsets.clear()
+            self.corrupt_lines = 0
+            self._appends_since_compaction = 0
+
+    def _write_atomic(self, records: List[Dict]):
+        tmp_file = self.log_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.log_file)
+
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+
+    def clear(self):
+        """
+        Supprime tout le journal
+        """
+        with self._exclusive():
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+            self.last_seq = 0
+            self._corrupt_offsets.clear()
+            self.corrupt_lines = 0
+            self._appends_since_compaction = 0
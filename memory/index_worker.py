@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+
+class MemoryIndexWorker:
+    def __init__(self, process: Callable[[List[Any]], None], max_queue_size: int = 1000,
+                 max_batch_size: int = 64):
+        """
+        Thread d'indexation en arrière-plan alimenté par une file bornée.
+        Les éléments disponibles sont traités par lots via la fonction process.
+        Une file pleine bloque l'appelant (contre-pression).
+        """
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.stats = {"processed": 0, "batches": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="memory-indexer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any):
+        """
+        Ajoute un élément à indexer (bloque si la file est pleine)
+        """
+        with self._condition:
+            self._pending += 1
+        self._queue.put(item)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Attend que tous les éléments soumis soient indexés.
+        Retourne False si le délai est dépassé.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def pending(self) -> int:
+        with self._condition:
+            return self._pending
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stop_after = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    next_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    stop_after = True
+                    break
+                batch.append(next_item)
+
+            try:
+                self.process(batch)
+                self.stats["processed"] += len(batch)
+                self.stats["batches"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Erreur lors de l'indexation en arrière-plan : {e}")
+            finally:
+                with self._condition:
+                    self._pending -= len(batch)
+                    self._condition.notify_all()
+
+            if stop_after:
+                return
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Traite les éléments restants puis arrête le thread
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,150 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en termes normalisés (minuscules, sans accents)
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(normalized)
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Index inversé BM25 des messages, avec index de métadonnées
+        (rôle, session, horodatage) pour le pré-filtrage
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[int, int] = {}
+        self.metadata: Dict[int, Dict] = {}
+        self.total_length = 0
+        self.by_role: Dict[str, Set[int]] = defaultdict(set)
+        self.by_session: Dict[str, Set[int]] = defaultdict(set)
+        self.by_time: List[Tuple[str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str, metadata: Dict):
+        """
+        Indexe un message
+        """
+        if doc_id in self.doc_lengths:
+            return
+
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self.postings[term][doc_id] = count
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+        role = metadata.get("role", "unknown")
+        session_id = metadata.get("session_id", "unknown")
+        timestamp = metadata.get("timestamp", "")
+        self.metadata[doc_id] = {"role": role, "session_id": session_id, "timestamp": timestamp}
+        self.by_role[role].add(doc_id)
+        self.by_session[session_id].add(doc_id)
+        insort(self.by_time, (timestamp, doc_id))
+
+    def filter_ids(self, role: Optional[str] = None, session_id: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None) -> Optional[Set[int]]:
+        """
+        Retourne les identifiants respectant les filtres, ou None s'il n'y a aucun filtre
+        """
+        candidates = None
+
+        def intersect(current: Optional[Set[int]], ids: Iterable[int]) -> Set[int]:
+            ids = set(ids)
+            return ids if current is None else current & ids
+
+        if role:
+            candidates = intersect(candidates, self.by_role.get(role, ()))
+        if session_id:
+            candidates = intersect(candidates, self.by_session.get(session_id, ()))
+        if since or until:
+            start = bisect_left(self.by_time, (since, -1)) if since else 0
+            # Une date seule en borne haute inclut toute la journée
+            if until and len(until) == 10:
+                until = until + "T23:59:59.999999"
+            end = bisect_right(self.by_time, (until, math.inf)) if until else len(self.by_time)
+            candidates = intersect(candidates, (doc_id for _, doc_id in self.by_time[start:end]))
+
+        return candidates
+
+    def search(self, query: str, k: int = 10,
+               candidates: Optional[Set[int]] = None) -> List[Tuple[int, float, float]]:
+        """
+        Recherche BM25 limitée aux candidats.
+        Retourne (identifiant, score, part des termes de la requête présents dans le message).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_lengths:
+            return []
+
+        doc_count = len(self.doc_lengths)
+        avg_length = self.total_length / doc_count
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+                matched[doc_id] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(doc_id, score, matched[doc_id] / len(terms)) for doc_id, score in ranked]
+
+    def to_dict(self) -> Dict:
+        """
+        Sérialise l'index (fréquences par message et métadonnées)
+        """
+        documents = defaultdict(dict)
+        for term, postings in self.postings.items():
+            for doc_id, tf in postings.items():
+                documents[doc_id][term] = tf
+        return {
+            "documents": {
+                str(doc_id): {"terms": documents.get(doc_id, {}), **self.metadata[doc_id]}
+                for doc_id in self.doc_lengths
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        index = cls()
+        for doc_id, doc in data.get("documents", {}).items():
+            doc_id = int(doc_id)
+            for term, tf in doc["terms"].items():
+                index.postings[term][doc_id] = tf
+            length = sum(doc["terms"].values())
+            index.doc_lengths[doc_id] = length
+            index.total_length += length
+            index.metadata[doc_id] = {
+                "role": doc["role"],
+                "session_id": doc["session_id"],
+                "timestamp": doc["timestamp"]
+            }
+            index.by_role[doc["role"]].add(doc_id)
+            index.by_session[doc["session_id"]].add(doc_id)
+            index.by_time.append((doc["timestamp"], doc_id))
+        index.by_time.sort()
+        return index
@@ -1,147 +1,155 @@
-import json
 import os
+import re
+from collections import deque
 from datetime import datetime
 from typing import List, Dict, Optional
-from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.schema import Document
+from memory.shard_store import ShardedMemoryStore, get_memory_store
+
+FILTER_PATTERN = re.compile(r"\b(role|session|since|until):(\S+)")
 
 class EnhancedMemoryManager:
-    def __init__(self, memory_file: str = "conversation_memory.json"):
+    def __init__(self, memory_file: str = "conversation_memory.json", recent_window: int = 200,
+                 session_id: Optional[str] = None, store: Optional[ShardedMemoryStore] = None,
+                 max_loaded_shards: int = 8, checkpoint_every: int = 100, index_batch_size: int = 256,
+                 async_indexing: bool = True, index_queue_size: int = 1000,
+                 exact_filter_limit: int = 5000, max_hot_messages: int = 20000,
+                 weak_match_distance: float = 0.5):
         self.memory_file = memory_file
-        self.conversations = self._load_memory()
-        self.embeddings = OpenAIEmbeddings()
-        self.memory_index = None
-        self._build_memory_index()
-    
+        # Session fixe (ex. un appelant de l'API), sinon session horaire
+        self.session_id = session_id
+        # Mémoire partitionnée par session ; l'ancien historique est migré au premier démarrage
+        self.store = store or get_memory_store(
+            store_dir=os.path.splitext(memory_file)[0] + "_store",
+            max_loaded_shards=max_loaded_shards,
+            checkpoint_every=checkpoint_every,
+            index_batch_size=index_batch_size,
+            async_indexing=async_indexing,
+            index_queue_size=index_queue_size,
+            exact_filter_limit=exact_filter_limit,
+            max_hot_messages=max_hot_messages,
+            weak_match_distance=weak_match_distance,
+            legacy_log_file=os.path.splitext(memory_file)[0] + ".jsonl",
+            legacy_file=memory_file
+        )
+        self.embeddings = self.store.embeddings
+        # Seuls les messages récents restent en mémoire
+        self.conversations = deque(
+            self.store.read_recent(recent_window, session_id=self.session_id),
+            maxlen=recent_window
+        )
+        # Seule la partition de la session courante est chargée au démarrage (si elle existe déjà)
+        if self._get_current_session() in self.store.manifest.sessions:
+            self.store.acquire(self._get_current_session())
+
     def add_message(self, role: str, content: str):
         """
         Ajoute un message à la mémoire
         """
+        session_id = self._get_current_session()
         message = {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat(),
-            "session_id": self._get_current_session()
+            "session_id": session_id
         }
-        
+
+        # Écriture durable dans le journal de la session ; l'embedding est fait en arrière-plan
+        message = self.store.append(session_id, message)
         self.conversations.append(message)
-        self._save_memory()
-        self._update_memory_index(message)
-    
-    def search_memory(self, query: str, k: int = 3) -> str:
+
+    def search_memory(self, query: str, k: int = 3, wait: bool = False, wait_timeout: float = 5.0,
+                      role: Optional[str] = None, session_id: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None) -> str:
         """
-        Recherche dans l'historique des conversations
+        Recherche hybride (BM25 + vecteurs) dans l'historique des conversations.
+        Filtres possibles dans la requête : role:user, session:current (ou un ID de session),
+        since:2024-01-01, until:2024-01-31. Seules les sessions concernées sont parcourues.
+        Avec wait=True, attend d'abord l'indexation des messages en attente.
         """
-        if not self.memory_index:
+        if wait:
+            self.flush(wait_timeout)
+
+        filters = {"role": role, "session": session_id, "since": since, "until": until}
+        for name, value in FILTER_PATTERN.findall(query):
+            filters[name] = filters[name] or value
+        if filters["session"] == "current" or self.session_id:
+            # Une session fixe (appelant de l'API) ne voit que son propre historique
+            filters["session"] = self._get_current_session()
+        text_query = FILTER_PATTERN.sub("", query).strip()
+
+        if not self.store.manifest.sessions:
             return "Aucun historique disponible pour la recherche."
-        
+
         try:
-            # Recherche de similarité
-            results = self.memory_index.similarity_search(query, k=k)
-            
+            results = self.store.search(
+                text_query,
+                k=k,
+                session_id=filters["session"],
+                role=filters["role"],
+                since=filters["since"],
+                until=filters["until"]
+            )
+
             if not results:
                 return f"Aucun résultat trouvé pour : {query}"
-            
+
             response = f"🧠 Recherche dans la mémoire pour '{query}':\n\n"
-            
+
             for i, doc in enumerate(results, 1):
                 metadata = doc.metadata
                 response += f"{i}. **{metadata.get('role', 'Unknown')}** "
                 response += f"({metadata.get('timestamp', 'Date inconnue')})\n"
                 response += f"   {doc.page_content[:200]}...\n\n"
-            
+
             return response
-            
+
         except Exception as e:
             return f"Erreur lors de la recherche en mémoire : {str(e)}"
-    
+
     def get_recent_messages(self, limit: int = 10) -> List[Dict]:
         """
         Récupère les messages récents
         """
-        return self.conversations[-limit:] if self.conversations else []
-    
+        # Au-delà de la fenêtre gardée en mémoire, lecture de la fin des journaux
+        if limit > len(self.conversations) == self.conversations.maxlen:
+            return self.store.read_recent(limit, session_id=self.session_id)
+        return list(self.conversations)[-limit:] if self.conversations else []
+
     def clear_memory(self):
         """
-        Efface toute la mémoire
+        Efface la mémoire de la session fixe, ou toute la mémoire
         """
-        self.conversations = []
-        self.memory_index = None
-        if os.path.exists(self.memory_file):
-            os.remove(self.memory_file)
-    
-    def _build_memory_index(self):
+        self.conversations.clear()
+        self.store.clear(self.session_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
         """
-        Construit l'index vectoriel de la mémoire
+        Barrière : attend que tous les messages ajoutés soient indexés
         """
-        if not self.conversations:
-            return
-        
-        try:
-            documents = []
-            for msg in self.conversations:
-                doc = Document(
-                    page_content=msg["content"],
-                    metadata={
-                        "role": msg["role"],
-                        "timestamp": msg["timestamp"],
-                        "session_id": msg.get("session_id", "unknown")
-                    }
-                )
-                documents.append(doc)
-            
-            if documents:
-                self.memory_index = FAISS.from_documents(documents, self.embeddings)
-        
-        except Exception as e:
-            print(f"Erreur lors de la construction de l'index mémoire : {e}")
-    
-    def _update_memory_index(self, message: Dict):
+        return self.store.flush(timeout)
+
+    def save_index(self):
         """
-        Met à jour l'index avec un nouveau message
+        Force la sauvegarde des index mémoire et du manifeste sur disque
         """
-        try:
-            doc = Document(
-                page_content=message["content"],
-                metadata={
-                    "role": message["role"],
-                    "timestamp": message["timestamp"],
-                    "session_id": message.get("session_id", "unknown")
-                }
-            )
-            
-            if self.memory_index:
-                # Ajouter le document à l'index existant
-                self.memory_index.add_documents([doc])
-            else:
-                # Créer un nouvel index
-                self.memory_index = FAISS.from_documents([doc], self.embeddings)
-        
-        except Exception as e:
-            print(f"Erreur lors de la mise à jour de l'index : {e}")
-    
-    def _load_memory(self) -> List[Dict]:
-        """
-        Charge la mémoire depuis le fichier
-        """
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-    
-    def _save_memory(self):
-        """
-        Sauvegarde la mémoire dans le fichier
-        """
-        with open(self.memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.conversations, f, ensure_ascii=False, indent=2)
-    
+        self.store.save()
+
+    def close(self):
+        """
+        Termine l'indexation en attente et sauvegarde les index
+        """
+        self.store.close()
+
+    def get_stats(self) -> Dict:
+        """
+        Retourne les statistiques de la mémoire (tiers chaud et froid, indexation en attente)
+        """
+        return self.store.get_stats()
+
     def _get_current_session(self) -> str:
         """
         Génère un ID de session basé sur la date
         """
-        return datetime.now().strftime("%Y%m%d_%H")
\ No newline at end of file
+        if self.session_id:
+            return self.session_id
+        return datetime.now().strftime("%Y%m%d_%H")
@@ -0,0 +1,506 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.schema import Document
+from memory.conversation_log import ConversationLog
+from memory.lexical_index import BM25Index
+from utils.file_lock import file_lock
+
+# Version du format de l'index persisté (identifiants par numéro de séquence + index lexical)
+INDEX_FORMAT_VERSION = 2
+
+# Lignes du tier froid : une par vecteur de l'index, dans le même ordre
+COLD_ROW_DTYPE = [("seq", "<i8"), ("offset", "<i8"), ("role", "<U16"), ("timestamp", "<U32")]
+# Projection en mémoire des vecteurs de l'index (IO_FLAG_MMAP seul les recopie en RAM pour un index plat)
+COLD_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class MemoryShard:
+    def __init__(self, session_id: str, shard_dir: str, embeddings, checkpoint_every: int = 100,
+                 index_batch_size: int = 256, exact_filter_limit: int = 5000):
+        """
+        Partition de la mémoire pour une session : son propre journal,
+        son index vectoriel et son index lexical, chargeables et déchargeables à la demande.
+        Plusieurs processus peuvent écrire dans la même partition : le journal est la référence,
+        l'index sauvegardé est remplacé sous verrou de fichier (index.lock) et ne recule jamais.
+        """
+        self.session_id = session_id
+        self.shard_dir = shard_dir
+        self.embeddings = embeddings
+        self.checkpoint_every = checkpoint_every
+        self.index_batch_size = index_batch_size
+        # En dessous de ce nombre de candidats filtrés, la recherche vectorielle est exacte
+        self.exact_filter_limit = exact_filter_limit
+
+        self.log = ConversationLog(log_file=os.path.join(shard_dir, "log.jsonl"), legacy_file=None)
+        self.index_dir = os.path.join(shard_dir, "index")
+        self._index_lock_file = os.path.join(shard_dir, "index.lock")
+        self.memory_index = None
+        self.lexical_index = BM25Index()
+        # Position de chaque message (numéro de séquence) dans l'index FAISS
+        self._positions: Dict[int, int] = {}
+        # Offset de chaque message dans le journal (lecture directe depuis le tier froid)
+        self._offsets: Dict[int, int] = {}
+        self._indexed_seq = 0
+        self._indexed_offset = 0
+        self._unsaved_count = 0
+        self.loaded = False
+        self.last_used = time.monotonic()
+        # Incrémenté à chaque effacement : les messages en file d'une génération précédente sont ignorés
+        self.generation = 0
+        # Dernier message couvert par l'index sauvegardé (None : point de reprise pas encore lu)
+        self._cold_seq: Optional[int] = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def to_document(message: Dict) -> Document:
+        return Document(
+            page_content=message["content"],
+            metadata={
+                "role": message["role"],
+                "timestamp": message["timestamp"],
+                "session_id": message.get("session_id", "unknown"),
+                "seq": message["seq"]
+            }
+        )
+
+    def append(self, message: Dict) -> Tuple[Dict, int]:
+        """
+        Ajoute un message au journal de la partition ; retourne (message, offset)
+        """
+        with self.lock:
+            record = self.log.append(message)
+            offset = self.log.last_offset
+            # L'index lexical est mis à jour immédiatement (peu coûteux)
+            if self.loaded:
+                self.lexical_index.add(record["seq"], record["content"], record)
+            self.last_used = time.monotonic()
+            return record, offset
+
+    def load(self):
+        """
+        Charge l'index persisté puis n'indexe que les messages ajoutés après le dernier point de reprise
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.loaded:
+                return
+
+            try:
+                with file_lock(self._index_lock_file):
+                    self._load_index_checkpoint()
+            except Exception as e:
+                print(f"Index de la session {self.session_id} illisible, reconstruction : {e}")
+                self._reset_index()
+
+            self._index_from_log()
+            self.loaded = True
+            if self._unsaved_count:
+                self.save()
+
+    def _index_from_log(self, generation: Optional[int] = None):
+        """
+        Indexe tous les messages du journal postérieurs au dernier message indexé
+        """
+        offset = self._indexed_offset
+        if not self.log.offset_is_valid(offset, self._indexed_seq):
+            # Journal compacté depuis le point de reprise : reprise par numéro de séquence
+            offset = 0
+
+        batch = []
+        for record_offset, message in self.log.iter_records(after_seq=self._indexed_seq, offset=offset,
+                                                            with_offset=True):
+            batch.append((message, record_offset))
+            if len(batch) >= self.index_batch_size:
+                self._index_batch(batch, generation)
+                batch = []
+        if batch:
+            self._index_batch(batch, generation)
+
+    def unload(self):
+        """
+        Sauvegarde puis libère les index de la partition
+        """
+        with self.lock:
+            if not self.loaded:
+                return
+            self.save()
+            self._reset_index()
+            self.loaded = False
+
+    def _reset_index(self):
+        self.memory_index = None
+        self.lexical_index = BM25Index()
+        self._positions = {}
+        self._offsets = {}
+        self._indexed_seq = 0
+        self._indexed_offset = 0
+        self._unsaved_count = 0
+
+    def index_messages(self, items: List[Tuple[Dict, int]], generation: Optional[int] = None):
+        """
+        Indexe des messages déjà écrits dans le journal (appelé par le thread d'indexation).
+        Une partition déchargée les rattrapera à son prochain chargement.
+        """
+        if not self.loaded:
+            return
+        with self.lock:
+            contiguous = items[0][0]["seq"] <= self._indexed_seq + 1 and all(
+                current[0]["seq"] == previous[0]["seq"] + 1 for previous, current in zip(items, items[1:])
+            )
+        if contiguous:
+            self._index_batch(items, generation)
+        else:
+            # Messages d'un autre processus intercalés : l'index reste un préfixe continu du journal
+            self._index_from_log(generation)
+        with self.lock:
+            if self._unsaved_count >= self.checkpoint_every:
+                self.save()
+
+    def _index_batch(self, items: List[Tuple[Dict, int]], generation: Optional[int] = None):
+        # Embeddings calculés hors verrou : les recherches ne sont bloquées que pendant l'ajout
+        documents = [self.to_document(message) for message, _ in items]
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embeddings.embed_documents(texts)
+
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            # Messages déjà indexés entre-temps (rattrapage au chargement)
+            keep = [i for i, doc in enumerate(documents) if doc.metadata["seq"] > self._indexed_seq]
+            if not keep:
+                return
+            documents = [documents[i] for i in keep]
+            pairs = [(texts[i], vectors[i]) for i in keep]
+            metadatas = [doc.metadata for doc in documents]
+            ids = [str(doc.metadata["seq"]) for doc in documents]
+
+            start = self.memory_index.index.ntotal if self.memory_index else 0
+            if self.memory_index:
+                self.memory_index.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            else:
+                self.memory_index = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=ids)
+            for position, (i, doc) in enumerate(zip(keep, documents), start):
+                self._positions[doc.metadata["seq"]] = position
+                self._offsets[doc.metadata["seq"]] = items[i][1]
+                self.lexical_index.add(doc.metadata["seq"], doc.page_content, doc.metadata)
+
+            self._indexed_seq = documents[-1].metadata["seq"]
+            self._indexed_offset = items[keep[-1]][1]
+            self._unsaved_count += len(documents)
+
+    def filter_ids(self, role: Optional[str] = None, since: Optional[str] = None,
+                   until: Optional[str] = None) -> Optional[Set[int]]:
+        with self.lock:
+            if self.loaded:
+                return self.lexical_index.filter_ids(role=role, since=since, until=until)
+        return self._cold_filter_ids(role=role, since=since, until=until)
+
+    def lexical_search(self, query: str, k: int,
+                       candidates: Optional[Set[int]] = None) -> List[Tuple[int, float, float]]:
+        with self.lock:
+            if self.loaded:
+                self.last_used = time.monotonic()
+                return self.lexical_index.search(query, k=k, candidates=candidates)
+        return self._cold_lexical_search(query, k, candidates)
+
+    def vector_search(self, query_vector: List[float], k: int,
+                      candidates: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Recherche vectorielle restreinte aux candidats filtrés ; retourne (numéro de séquence, distance).
+        Une partition déchargée est interrogée dans le tier froid.
+        """
+        with self.lock:
+            if not self.loaded:
+                return self._cold_vector_search(query_vector, k, candidates)
+            self.last_used = time.monotonic()
+            if not self.memory_index:
+                return []
+
+            if candidates is not None and len(candidates) <= self.exact_filter_limit:
+                # Pré-filtrage : distance calculée uniquement sur les vecteurs candidats
+                seqs = [seq for seq in candidates if seq in self._positions]
+                if not seqs:
+                    return []
+                vectors = np.vstack([self.memory_index.index.reconstruct(self._positions[seq]) for seq in seqs])
+                distances = ((vectors - np.asarray(query_vector, dtype=np.float32)) ** 2).sum(axis=1)
+                return [(seqs[i], float(distances[i])) for i in np.argsort(distances)[:k]]
+
+            search_filter = None
+            if candidates is not None:
+                search_filter = lambda metadata: metadata.get("seq") in candidates
+            results = self.memory_index.similarity_search_with_score_by_vector(
+                query_vector,
+                k=k,
+                filter=search_filter,
+                fetch_k=max(20, k * 20)
+            )
+            return [(doc.metadata["seq"], float(score)) for doc, score in results]
+
+    def get_message(self, seq: int) -> Optional[Document]:
+        """
+        Retrouve un message par numéro de séquence (index vectoriel, sinon journal)
+        """
+        with self.lock:
+            if self.memory_index:
+                doc = self.memory_index.docstore.search(str(seq))
+                if isinstance(doc, Document):
+                    return doc
+            offset = self._offsets.get(seq)
+
+        if offset is None and not self.loaded:
+            rows = self._open_cold_rows()
+            position = self._cold_position(rows, seq) if rows is not None else None
+            if position is not None:
+                offset = int(rows["offset"][position])
+
+        # Lecture directe à l'offset connu, sinon parcours du journal (après un compactage)
+        for start in ([offset, 0] if offset else [0]):
+            for message in self.log.iter_records(after_seq=seq - 1, offset=start):
+                if message["seq"] == seq:
+                    return self.to_document(message)
+                break
+        return None
+
+    def message_count(self) -> int:
+        return self.log.last_seq
+
+    def hot_count(self) -> int:
+        """
+        Nombre de messages indexés en mémoire
+        """
+        with self.lock:
+            return len(self._positions) if self.loaded else 0
+
+    def hot_bytes(self) -> int:
+        """
+        Taille approximative des vecteurs résidents en mémoire
+        """
+        with self.lock:
+            if not self.loaded or not self.memory_index:
+                return 0
+            index = self.memory_index.index
+            return index.ntotal * index.d * 4
+
+    @staticmethod
+    def cold_bytes_of(shard_dir: str) -> int:
+        """
+        Taille sur disque du tier froid d'une partition (vecteurs et lignes)
+        """
+        index_dir = os.path.join(shard_dir, "index")
+        return sum(
+            os.path.getsize(os.path.join(index_dir, name))
+            for name in ("index.faiss", "rows.npy")
+            if os.path.exists(os.path.join(index_dir, name))
+        )
+
+    def has_cold_index(self) -> bool:
+        """
+        Vrai si l'index sauvegardé couvre tout le journal : la partition peut alors
+        être interrogée sans être chargée
+        """
+        with self.lock, file_lock(self._index_lock_file, shared=True):
+            return self._cold_index_current()
+
+    def _cold_index_current(self) -> bool:
+        if self._cold_seq is None or self._cold_seq != self.log.last_seq:
+            # Index ou journal modifiés par un autre processus depuis la dernière lecture
+            self._cold_seq = self._read_checkpoint_seq()
+            self.log.refresh()
+        return self._cold_seq > 0 and self._cold_seq == self.log.last_seq
+
+    def _read_checkpoint_seq(self) -> int:
+        checkpoint_file = os.path.join(self.index_dir, "checkpoint.json")
+        if not os.path.exists(os.path.join(self.index_dir, "rows.npy")) or not os.path.exists(checkpoint_file):
+            return 0
+        try:
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except Exception:
+            return 0
+        if checkpoint.get("version") != INDEX_FORMAT_VERSION \
+                or checkpoint.get("model") != getattr(self.embeddings, "model", "unknown"):
+            return 0
+        return checkpoint.get("seq", 0)
+
+    def _open_cold_rows(self) -> Optional[np.ndarray]:
+        """
+        Projette en mémoire les lignes du tier froid (rien n'est gardé entre deux recherches).
+        À appeler sous le verrou partagé de l'index.
+        """
+        if not self._cold_index_current():
+            return None
+        return np.load(os.path.join(self.index_dir, "rows.npy"), mmap_mode="r")
+
+    @staticmethod
+    def _cold_position(rows: np.ndarray, seq: int) -> Optional[int]:
+        # Les numéros de séquence sont croissants dans l'ordre de l'index
+        position = int(np.searchsorted(rows["seq"], seq))
+        if position < len(rows) and rows["seq"][position] == seq:
+            return position
+        return None
+
+    def _cold_filter_ids(self, role: Optional[str] = None, since: Optional[str] = None,
+                         until: Optional[str] = None) -> Optional[Set[int]]:
+        if not (role or since or until):
+            return None
+        with file_lock(self._index_lock_file, shared=True):
+            rows = self._open_cold_rows()
+        if rows is None:
+            return set()
+        mask = np.ones(len(rows), dtype=bool)
+        if role:
+            mask &= rows["role"] == role
+        if since:
+            mask &= rows["timestamp"] >= since
+        if until:
+            if len(until) == 10:
+                until = until + "T23:59:59.999999"
+            mask &= rows["timestamp"] <= until
+        return {int(seq) for seq in rows["seq"][mask]}
+
+    def _cold_vector_search(self, query_vector: List[float], k: int,
+                            candidates: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Recherche exacte dans l'index sauvegardé, projeté en mémoire (mmap) et non chargé en RAM
+        """
+        # Lignes et vecteurs projetés depuis la même sauvegarde ; les projections survivent au remplacement
+        with file_lock(self._index_lock_file, shared=True):
+            rows = self._open_cold_rows()
+            index = faiss.read_index(os.path.join(self.index_dir, "index.faiss"), COLD_MMAP_FLAGS) \
+                if rows is not None else None
+        if rows is None:
+            return []
+
+        params = None
+        if candidates is not None:
+            positions = [p for p in (self._cold_position(rows, seq) for seq in candidates) if p is not None]
+            if not positions:
+                return []
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(positions, dtype=np.int64)))
+            k = min(k, len(positions))
+
+        query = np.asarray([query_vector], dtype=np.float32)
+        distances, positions = index.search(query, min(k, index.ntotal), params=params)
+        return [(int(rows["seq"][p]), float(d)) for p, d in zip(positions[0], distances[0]) if p >= 0]
+
+    def _cold_lexical_search(self, query: str, k: int,
+                             candidates: Optional[Set[int]] = None) -> List[Tuple[int, float, float]]:
+        """
+        Recherche BM25 dans l'index lexical sauvegardé (lu pour la requête, non conservé) :
+        les noms et identifiants exacts des anciennes sessions restent trouvables sans charger la partition
+        """
+        with self.lock, file_lock(self._index_lock_file, shared=True):
+            if not self._cold_index_current():
+                return []
+            try:
+                with open(os.path.join(self.index_dir, "lexical.json"), "r", encoding="utf-8") as f:
+                    lexical_index = BM25Index.from_dict(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Index lexical de la session {self.session_id} illisible : {e}")
+                return []
+        return lexical_index.search(query, k=k, candidates=candidates)
+
+    def _load_index_checkpoint(self):
+        """
+        Charge l'index sauvegardé si son point de reprise est cohérent avec le journal
+        """
+        # Une sauvegarde interrompue laisse l'ancienne version en .bak
+        if not os.path.exists(self.index_dir) and os.path.exists(self.index_dir + ".bak"):
+            os.replace(self.index_dir + ".bak", self.index_dir)
+
+        checkpoint_file = os.path.join(self.index_dir, "checkpoint.json")
+        if not os.path.exists(checkpoint_file):
+            return
+
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+
+        if checkpoint.get("version") != INDEX_FORMAT_VERSION \
+                or checkpoint.get("model") != getattr(self.embeddings, "model", "unknown") \
+                or checkpoint.get("seq", 0) > self.log.last_seq:
+            print(f"Index de la session {self.session_id} obsolète : reconstruction complète.")
+            return
+
+        # L'index a été écrit par cette partition : la désérialisation est sûre
+        self.memory_index = FAISS.load_local(
+            self.index_dir,
+            self.embeddings,
+            allow_dangerous_deserialization=True
+        )
+        self._positions = {int(doc_id): position
+                           for position, doc_id in self.memory_index.index_to_docstore_id.items()}
+        with open(os.path.join(self.index_dir, "lexical.json"), "r", encoding="utf-8") as f:
+            self.lexical_index = BM25Index.from_dict(json.load(f))
+        rows_file = os.path.join(self.index_dir, "rows.npy")
+        if os.path.exists(rows_file):
+            rows = np.load(rows_file)
+            self._offsets = dict(zip(rows["seq"].tolist(), rows["offset"].tolist()))
+        else:
+            # Sauvegarde antérieure au tier froid : réécrite au chargement
+            self._unsaved_count = len(self._positions)
+        self._indexed_seq = checkpoint["seq"]
+        self._indexed_offset = checkpoint.get("offset", 0)
+
+    def save(self):
+        """
+        Sauvegarde l'index et son point de reprise (remplacement atomique du dossier, sous verrou de fichier).
+        Une sauvegarde plus avancée d'un autre processus n'est pas écrasée.
+        """
+        with self.lock, file_lock(self._index_lock_file):
+            if not self.memory_index or not self._unsaved_count:
+                return
+            saved_seq = self._read_checkpoint_seq()
+            if saved_seq >= self._indexed_seq and saved_seq <= self.log.refresh():
+                self._cold_seq = saved_seq
+                return
+
+            tmp_dir = f"{self.index_dir}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self.memory_index.save_local(tmp_dir)
+            with open(os.path.join(tmp_dir, "lexical.json"), "w", encoding="utf-8") as f:
+                json.dump(self.lexical_index.to_dict(), f, ensure_ascii=False)
+
+            # Lignes du tier froid, alignées sur les positions de l'index FAISS
+            seqs = sorted(self._positions, key=self._positions.get)
+            rows = np.zeros(len(seqs), dtype=COLD_ROW_DTYPE)
+            for i, seq in enumerate(seqs):
+                metadata = self.lexical_index.metadata.get(seq, {})
+                rows[i] = (seq, self._offsets.get(seq, 0), metadata.get("role", "unknown"),
+                           metadata.get("timestamp", ""))
+            np.save(os.path.join(tmp_dir, "rows.npy"), rows)
+            with open(os.path.join(tmp_dir, "checkpoint.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": INDEX_FORMAT_VERSION,
+                    "seq": self._indexed_seq,
+                    "offset": self._indexed_offset,
+                    "model": getattr(self.embeddings, "model", "unknown"),
+                    "saved_at": datetime.now().isoformat()
+                }, f)
+
+            if os.path.exists(self.index_dir):
+                shutil.rmtree(self.index_dir + ".bak", ignore_errors=True)
+                os.replace(self.index_dir, self.index_dir + ".bak")
+            os.replace(tmp_dir, self.index_dir)
+            shutil.rmtree(self.index_dir + ".bak", ignore_errors=True)
+            self._unsaved_count = 0
+            self._cold_seq = self._indexed_seq
+
+    def clear(self):
+        """
+        Efface le journal et les index de la partition
+        """
+        with self.lock, file_lock(self._index_lock_file):
+            self.generation += 1
+            self._reset_index()
+            self._cold_seq = 0
+            self.log.clear()
+            shutil.rmtree(self.index_dir, ignore_errors=True)
@@ -0,0 +1,539 @@
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+from langchain.schema import Document
+from memory.conversation_log import ConversationLog
+from memory.index_worker import MemoryIndexWorker
+from memory.lexical_index import tokenize
+from memory.memory_shard import MemoryShard
+from retriever.embedding_cache import get_shared_embeddings
+from utils.file_lock import file_lock
+
+
+class ShardManifest:
+    def __init__(self, manifest_file: str):
+        """
+        Manifeste léger des partitions : pour chaque session, son dossier,
+        sa plage temporelle et son nombre de messages.
+        Partagé entre processus : la sauvegarde fusionne, sous verrou de fichier, les entrées
+        écrites entre-temps par les autres processus ; une modification du fichier est relue à la sélection.
+        """
+        self.manifest_file = manifest_file
+        self.sessions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = 0
+        # Sessions effacées depuis la dernière sauvegarde (à retirer du fichier)
+        self._removed = set()
+        self._mtime_ns = None
+        try:
+            with self._lock:
+                self._merge(self._read())
+        except Exception as e:
+            print(f"Manifeste mémoire illisible, reconstruction : {e}")
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        self._mtime_ns = os.stat(self.manifest_file).st_mtime_ns
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("sessions", {})
+
+    def _merge(self, sessions: Dict[str, Dict]):
+        """
+        Fusionne des entrées lues sur disque : plage temporelle la plus large, compte le plus élevé
+        """
+        for session_id, other in sessions.items():
+            if session_id in self._removed:
+                continue
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                self.sessions[session_id] = dict(other)
+                continue
+            entry["first_ts"] = min(entry["first_ts"], other["first_ts"])
+            entry["last_ts"] = max(entry["last_ts"], other["last_ts"])
+            entry["count"] = max(entry["count"], other["count"])
+
+    def _refresh(self):
+        # Un autre processus a sauvegardé le manifeste : ses sessions deviennent visibles
+        try:
+            if os.path.exists(self.manifest_file) \
+                    and os.stat(self.manifest_file).st_mtime_ns != self._mtime_ns:
+                self._merge(self._read())
+        except (OSError, ValueError):
+            pass
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_file)
+
+    def update(self, session_id: str, directory: str, timestamp: str, count: int):
+        with self._lock:
+            entry = self.sessions.setdefault(session_id, {
+                "dir": directory,
+                "first_ts": timestamp,
+                "last_ts": timestamp,
+                "count": 0
+            })
+            entry["first_ts"] = min(entry["first_ts"], timestamp)
+            entry["last_ts"] = max(entry["last_ts"], timestamp)
+            entry["count"] = count
+            self._dirty += 1
+
+    def pending_changes(self) -> int:
+        with self._lock:
+            return self._dirty
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            self._removed.add(session_id)
+            self._dirty += 1
+
+    def select(self, session_id: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None) -> List[str]:
+        """
+        Sessions concernées par une requête, de la plus récente à la plus ancienne
+        """
+        if until and len(until) == 10:
+            until = until + "T23:59:59.999999"
+        with self._lock:
+            self._refresh()
+            selected = []
+            for sid, entry in self.sessions.items():
+                if session_id and sid != session_id:
+                    continue
+                if since and entry["last_ts"] < since:
+                    continue
+                if until and entry["first_ts"] > until:
+                    continue
+                selected.append((entry["last_ts"], sid))
+        return [sid for _, sid in sorted(selected, reverse=True)]
+
+    def save(self, force: bool = False):
+        """
+        Écrit le manifeste (remplacement atomique) après fusion avec la version sur disque
+        """
+        with self._lock:
+            if not self._dirty and not force:
+                return
+            with file_lock(self.manifest_file + ".lock"):
+                try:
+                    self._merge(self._read())
+                except (OSError, ValueError) as e:
+                    print(f"Manifeste mémoire illisible, réécriture : {e}")
+                tmp_file = f"{self.manifest_file}.tmp-{os.getpid()}"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump({"sessions": self.sessions}, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, self.manifest_file)
+                self._mtime_ns = os.stat(self.manifest_file).st_mtime_ns
+            self._removed.clear()
+            self._dirty = 0
+
+
+class ShardedMemoryStore:
+    def __init__(self, store_dir: str = "conversation_memory_store", embeddings=None,
+                 max_loaded_shards: int = 8, checkpoint_every: int = 100, index_batch_size: int = 256,
+                 async_indexing: bool = True, index_queue_size: int = 1000, exact_filter_limit: int = 5000,
+                 manifest_save_every: int = 20, legacy_log_file: Optional[str] = None,
+                 legacy_file: Optional[str] = None, max_hot_messages: int = 20000,
+                 weak_match_distance: float = 0.5):
+        """
+        Mémoire partitionnée par session : un journal et des index par partition,
+        un manifeste pour ne toucher que les partitions utiles à une requête.
+        Tier chaud : au plus max_loaded_shards partitions et max_hot_messages messages chargés (LRU).
+        Tier froid : les autres partitions, interrogées sur disque (mmap) seulement
+        quand le tier chaud ne donne pas assez de résultats proches (distance <= weak_match_distance).
+        Plusieurs processus peuvent partager le dossier (workers uvicorn, Streamlit) : les écritures
+        sont coordonnées par partition (verrous du journal et de l'index) et par le verrou du manifeste.
+        Dans un processus, get_memory_store retourne un stockage unique par dossier.
+        """
+        self.store_dir = store_dir
+        self.shards_dir = os.path.join(store_dir, "shards")
+        os.makedirs(self.shards_dir, exist_ok=True)
+        self.embeddings = embeddings or get_shared_embeddings()
+        self.max_loaded_shards = max_loaded_shards
+        self.max_hot_messages = max_hot_messages
+        self.weak_match_distance = weak_match_distance
+        self.manifest_save_every = manifest_save_every
+        self.shard_options = {
+            "checkpoint_every": checkpoint_every,
+            "index_batch_size": index_batch_size,
+            "exact_filter_limit": exact_filter_limit
+        }
+        self._shards: Dict[str, MemoryShard] = {}
+        self._loaded: "OrderedDict[str, MemoryShard]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"shard_loads": 0, "shard_unloads": 0, "shards_searched": 0,
+                      "cold_searches": 0, "cold_skipped": 0}
+
+        self.manifest = ShardManifest(os.path.join(store_dir, "manifest.json"))
+        self._migrate_legacy(legacy_log_file, legacy_file)
+        self._reconcile_manifest()
+
+        # Indexation hors du chemin critique de la conversation
+        self.index_worker = MemoryIndexWorker(
+            self._index_pending,
+            max_queue_size=index_queue_size
+        ) if async_indexing else None
+
+    @staticmethod
+    def _shard_dirname(session_id: str) -> str:
+        return re.sub(r"[^\w.-]", "_", session_id)
+
+    def _migrate_legacy(self, legacy_log_file: Optional[str], legacy_file: Optional[str]):
+        """
+        Migration unique du journal unique (et de l'ancien JSON) vers des partitions par session
+        """
+        if self.manifest.exists() or not legacy_log_file:
+            return
+        if not os.path.exists(legacy_log_file) and not (legacy_file and os.path.exists(legacy_file)):
+            return
+
+        legacy_log = ConversationLog(log_file=legacy_log_file, legacy_file=legacy_file)
+        by_session = defaultdict(list)
+        for record in legacy_log.iter_records():
+            message = {key: value for key, value in record.items() if key != "seq"}
+            by_session[message.get("session_id", "unknown")].append(message)
+
+        for session_id, messages in by_session.items():
+            shard = self.shard(session_id)
+            shard.log.extend(messages)
+            for message in (messages[0], messages[-1]):
+                self.manifest.update(session_id, self._shard_dirname(session_id),
+                                     message["timestamp"], shard.log.last_seq)
+        self.manifest.save(force=True)
+
+        os.replace(legacy_log_file, legacy_log_file + ".migrated")
+        shutil.rmtree(os.path.splitext(legacy_log_file)[0] + "_index", ignore_errors=True)
+
+    def _reconcile_manifest(self):
+        """
+        Met le manifeste en cohérence avec les journaux des partitions
+        (écritures postérieures à la dernière sauvegarde du manifeste)
+        """
+        known = {entry["dir"]: (sid, entry) for sid, entry in self.manifest.sessions.items()}
+        for directory in os.listdir(self.shards_dir):
+            log_file = os.path.join(self.shards_dir, directory, "log.jsonl")
+            if not os.path.exists(log_file):
+                continue
+            log = ConversationLog(log_file, legacy_file=None)
+            if directory in known and known[directory][1]["count"] == log.last_seq:
+                continue
+
+            first = next(log.iter_records(), None)
+            if first is None:
+                continue
+            last = log.read_tail(1)[0]
+            session_id = known[directory][0] if directory in known else first.get("session_id", directory)
+            for message in (first, last):
+                self.manifest.update(session_id, directory, message["timestamp"], last["seq"])
+        self.manifest.save()
+
+    def shard(self, session_id: str) -> MemoryShard:
+        """
+        Retourne la partition d'une session (sans charger ses index)
+        """
+        with self._lock:
+            shard = self._shards.get(session_id)
+            if shard is None:
+                entry = self.manifest.sessions.get(session_id)
+                directory = entry["dir"] if entry else self._shard_dirname(session_id)
+                shard = MemoryShard(session_id, os.path.join(self.shards_dir, directory),
+                                    self.embeddings, **self.shard_options)
+                self._shards[session_id] = shard
+            return shard
+
+    def acquire(self, session_id: str) -> MemoryShard:
+        """
+        Retourne la partition chargée, en déchargeant les moins récemment utilisées au-delà de la limite
+        """
+        shard = self.shard(session_id)
+        with self._lock:
+            if session_id in self._loaded:
+                self._loaded.move_to_end(session_id)
+                return shard
+
+        shard.load()
+        with self._lock:
+            self._loaded[session_id] = shard
+            self._loaded.move_to_end(session_id)
+            self.stats["shard_loads"] += 1
+        self._enforce_hot_limits()
+        return shard
+
+    def _enforce_hot_limits(self):
+        """
+        Décharge vers le tier froid les partitions les moins récemment utilisées
+        au-delà de max_loaded_shards ou de max_hot_messages
+        """
+        with self._lock:
+            evicted = []
+            hot_messages = sum(loaded.hot_count() for loaded in self._loaded.values())
+            # La partition la plus récemment utilisée reste chargée même si elle dépasse seule la limite
+            while len(self._loaded) > 1 and (len(self._loaded) > self.max_loaded_shards
+                                             or hot_messages > self.max_hot_messages):
+                _, oldest = self._loaded.popitem(last=False)
+                hot_messages -= oldest.hot_count()
+                evicted.append(oldest)
+        for oldest in evicted:
+            self.unload(oldest)
+
+    def unload(self, shard: MemoryShard):
+        """
+        Décharge une partition (ses index restent sur disque)
+        """
+        with self._lock:
+            self._loaded.pop(shard.session_id, None)
+            self.stats["shard_unloads"] += 1
+        shard.unload()
+
+    def append(self, session_id: str, message: Dict) -> Dict:
+        """
+        Écrit un message dans la partition de sa session et planifie son indexation
+        """
+        shard = self.acquire(session_id)
+        record, offset = shard.append(message)
+        self.manifest.update(session_id, os.path.basename(shard.shard_dir),
+                             record["timestamp"], record["seq"])
+        if self.manifest.pending_changes() >= self.manifest_save_every:
+            self.manifest.save()
+
+        if self.index_worker is not None:
+            self.index_worker.submit((shard, shard.generation, record, offset))
+        else:
+            shard.index_messages([(record, offset)])
+            self._enforce_hot_limits()
+        return record
+
+    def _index_pending(self, items: List):
+        """
+        Traite un lot de messages en attente, regroupés par partition
+        """
+        grouped = OrderedDict()
+        for shard, generation, record, offset in items:
+            grouped.setdefault((shard.session_id, generation), (shard, []))[1].append((record, offset))
+        for (session_id, generation), (shard, batch) in grouped.items():
+            with self._lock:
+                # Partition effacée et supprimée depuis l'ajout
+                if self._shards.get(session_id) is not shard:
+                    continue
+            shard.index_messages(batch, generation)
+        self._enforce_hot_limits()
+
+    def search(self, query: str, k: int, session_id: Optional[str] = None, role: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None) -> List[Document]:
+        """
+        Recherche hybride limitée aux partitions concernées par les filtres.
+        Le tier chaud est interrogé d'abord ; le tier froid seulement si ses résultats sont faibles.
+        """
+        session_ids = self.manifest.select(session_id=session_id, since=since, until=until)
+        has_terms = bool(tokenize(query))
+
+        # Une session demandée explicitement est chargée ; les partitions sans index à jour aussi
+        hot_ids, cold_ids = [], []
+        for sid in session_ids:
+            shard = self.shard(sid)
+            if sid == session_id or shard.loaded or not shard.has_cold_index():
+                hot_ids.append(sid)
+            else:
+                cold_ids.append(sid)
+
+        lexical_hits = []
+        candidates_by_shard = {}
+        for sid in hot_ids:
+            shard = self.acquire(sid)
+            with self._lock:
+                self.stats["shards_searched"] += 1
+            candidates = shard.filter_ids(role=role, since=since, until=until)
+            if candidates is not None and not candidates:
+                continue
+            candidates_by_shard[sid] = candidates
+            if has_terms:
+                for seq, score, coverage in shard.lexical_search(query, k * 4, candidates):
+                    lexical_hits.append(((sid, seq), score, coverage))
+
+        if not has_terms:
+            for sid in cold_ids:
+                candidates_by_shard[sid] = self.shard(sid).filter_ids(role=role, since=since, until=until)
+            return self._most_recent(candidates_by_shard, k)
+
+        # Correspondances exactes du tier froid (index lexical sauvegardé, partition non chargée)
+        cold_candidates = {}
+        for sid in cold_ids:
+            shard = self.shard(sid)
+            candidates = shard.filter_ids(role=role, since=since, until=until)
+            cold_candidates[sid] = candidates
+            if candidates is not None and not candidates:
+                continue
+            for seq, score, coverage in shard.lexical_search(query, k * 4, candidates):
+                lexical_hits.append(((sid, seq), score, coverage))
+
+        lexical_hits.sort(key=lambda hit: hit[1], reverse=True)
+
+        # Des correspondances exactes en nombre suffisant dispensent de l'embedding de la requête
+        full_matches = [hit for hit in lexical_hits if hit[2] == 1.0]
+        if len(full_matches) >= k or (not candidates_by_shard and not cold_ids):
+            keys = [key for key, _, _ in lexical_hits[:k]]
+            if cold_ids:
+                with self._lock:
+                    self.stats["cold_skipped"] += 1
+        else:
+            query_vector = self.embeddings.embed_query(query)
+            vector_hits = []
+            for sid, candidates in candidates_by_shard.items():
+                for seq, distance in self.shard(sid).vector_search(query_vector, k * 4, candidates):
+                    vector_hits.append(((sid, seq), distance))
+
+            strong = {key for key, _, _ in full_matches}
+            strong.update(key for key, distance in vector_hits if distance <= self.weak_match_distance)
+            if len(strong) < k and cold_ids:
+                vector_hits.extend(self._cold_search(cold_ids, query_vector, k, cold_candidates))
+            elif cold_ids:
+                with self._lock:
+                    self.stats["cold_skipped"] += 1
+
+            vector_hits.sort(key=lambda hit: hit[1])
+            keys = self._fuse([key for key, _, _ in lexical_hits], [key for key, _ in vector_hits])[:k]
+
+        results = []
+        for sid, seq in keys:
+            doc = self.shard(sid).get_message(seq)
+            if doc is not None:
+                results.append(doc)
+        return results
+
+    def _cold_search(self, session_ids: List[str], query_vector: List[float], k: int,
+                     candidates_by_shard: Dict) -> List:
+        """
+        Recherche vectorielle dans les partitions du tier froid, sans les charger
+        """
+        with self._lock:
+            self.stats["cold_searches"] += 1
+        hits = []
+        for sid in session_ids:
+            shard = self.shard(sid)
+            candidates = candidates_by_shard.get(sid)
+            if candidates is not None and not candidates:
+                continue
+            for seq, distance in shard.vector_search(query_vector, k * 4, candidates):
+                hits.append(((sid, seq), distance))
+        return hits
+
+    def _most_recent(self, candidates_by_shard: Dict, k: int) -> List[Document]:
+        """
+        Requête réduite aux filtres : les k messages les plus récents parmi les candidats
+        """
+        documents = []
+        for sid, candidates in candidates_by_shard.items():
+            shard = self.shard(sid)
+            seqs = sorted(candidates, reverse=True)[:k] if candidates is not None \
+                else [message["seq"] for message in shard.log.read_tail(k)]
+            documents.extend(doc for doc in (shard.get_message(seq) for seq in seqs) if doc is not None)
+        documents.sort(key=lambda doc: doc.metadata.get("timestamp", ""), reverse=True)
+        return documents[:k]
+
+    @staticmethod
+    def _fuse(*rankings: List, constant: int = 60) -> List:
+        """
+        Fusion des classements lexical et vectoriel (Reciprocal Rank Fusion)
+        """
+        scores: Dict = {}
+        for ranking in rankings:
+            for rank, key in enumerate(ranking):
+                scores[key] = scores.get(key, 0.0) + 1.0 / (constant + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def read_recent(self, limit: int, session_id: Optional[str] = None) -> List[Dict]:
+        """
+        Derniers messages, d'une session ou de toutes, en ne lisant que la fin des journaux
+        """
+        messages = []
+        for sid in self.manifest.select(session_id=session_id):
+            tail = self.shard(sid).log.read_tail(limit - len(messages))
+            messages = tail + messages
+            if len(messages) >= limit:
+                break
+        return messages
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Barrière : attend que tous les messages ajoutés soient indexés
+        """
+        if self.index_worker is None:
+            return True
+        return self.index_worker.flush(timeout)
+
+    def save(self):
+        with self._lock:
+            shards = list(self._loaded.values())
+        for shard in shards:
+            shard.save()
+        self.manifest.save()
+
+    def close(self):
+        """
+        Termine l'indexation en attente et sauvegarde les index et le manifeste
+        """
+        if self.index_worker is not None:
+            self.index_worker.stop()
+        self.save()
+
+    def clear(self, session_id: Optional[str] = None):
+        """
+        Efface une session, ou toute la mémoire
+        """
+        session_ids = [session_id] if session_id else list(self.manifest.sessions)
+        for sid in session_ids:
+            shard = self.shard(sid)
+            with self._lock:
+                self._loaded.pop(sid, None)
+                self._shards.pop(sid, None)
+            shard.clear()
+            shard.loaded = False
+            shutil.rmtree(shard.shard_dir, ignore_errors=True)
+            self.manifest.remove(sid)
+        self.manifest.save(force=True)
+
+    def get_stats(self) -> Dict:
+        """
+        Statistiques de la mémoire, dont la taille des tiers chaud et froid
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["loaded_shards"] = len(self._loaded)
+            loaded = list(self._loaded.values())
+        stats["total_shards"] = len(self.manifest.sessions)
+        stats["max_loaded_shards"] = self.max_loaded_shards
+        stats["max_hot_messages"] = self.max_hot_messages
+        stats["hot_messages"] = sum(shard.hot_count() for shard in loaded)
+        stats["hot_bytes"] = sum(shard.hot_bytes() for shard in loaded)
+        stats["cold_messages"] = sum(entry["count"] for entry in self.manifest.sessions.values()) \
+            - stats["hot_messages"]
+        with self._lock:
+            loaded_ids = set(self._loaded)
+        stats["cold_bytes"] = sum(
+            MemoryShard.cold_bytes_of(os.path.join(self.shards_dir, entry["dir"]))
+            for sid, entry in self.manifest.sessions.items() if sid not in loaded_ids
+        )
+        stats["pending_index"] = self.index_worker.pending() if self.index_worker else 0
+        return stats
+
+
+_shared_stores: Dict[str, ShardedMemoryStore] = {}
+_shared_lock = threading.Lock()
+
+
+def get_memory_store(store_dir: str = "conversation_memory_store", **options) -> ShardedMemoryStore:
+    """
+    Retourne le stockage partagé du processus pour ce dossier (options appliquées à la première création)
+    """
+    key = os.path.abspath(store_dir)
+    with _shared_lock:
+        store = _shared_stores.get(key)
+        if store is None:
+            store = _shared_stores[key] = ShardedMemoryStore(store_dir=store_dir, **options)
+        return store
@@ -0,0 +1,132 @@
+# retriever/embedding_batcher.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from utils.rate_limiter import TokenBucket
+
+
+class _PendingRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.vectors: Optional[List[List[float]]] = None
+        self.error: Optional[Exception] = None
+
+
+class EmbeddingBatcher(Embeddings):
+    def __init__(self, underlying: Embeddings, window_ms: float = 5, max_batch_size: int = 256,
+                 max_concurrency: int = 4, requests_per_second: float = 0):
+        """
+        Regroupe les appels d'embeddings concurrents en une seule requête.
+        Les demandes sont collectées pendant une courte fenêtre (ou jusqu'à max_batch_size textes),
+        envoyées ensemble, puis chaque appelant reçoit ses propres vecteurs.
+        """
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", "unknown")
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.rate_limiter = TokenBucket(requests_per_second) if requests_per_second > 0 else None
+        # Le pool borne le nombre de requêtes simultanées vers le fournisseur
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._pending: List[_PendingRequest] = []
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self.stats = {"calls": 0, "batches": 0, "texts": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        with self._condition:
+            self.stats["calls"] += 1
+
+        # Un appel déjà plus gros qu'un lot part directement
+        if len(texts) >= self.max_batch_size:
+            return self._executor.submit(self._send, texts).result()
+
+        request = _PendingRequest(texts)
+        with self._condition:
+            self._ensure_dispatcher()
+            self._pending.append(request)
+            self._condition.notify()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-batcher", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """
+        Attend la fin de la fenêtre de collecte (ou un lot plein) puis envoie le lot
+        """
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                deadline = self._pending[0].created + self.window
+                while self._pending_size() < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch, size = [], 0
+                while self._pending and size + len(self._pending[0].texts) <= self.max_batch_size:
+                    request = self._pending.pop(0)
+                    batch.append(request)
+                    size += len(request.texts)
+
+            self._executor.submit(self._run_batch, batch)
+
+    def _pending_size(self) -> int:
+        return sum(len(request.texts) for request in self._pending)
+
+    def _send(self, texts: List[str]) -> List[List[float]]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        vectors = self.underlying.embed_documents(texts)
+        with self._condition:
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+        return vectors
+
+    def _run_batch(self, batch: List[_PendingRequest]):
+        """
+        Envoie un lot combiné et redistribue les vecteurs à chaque appelant
+        """
+        texts = [text for request in batch for text in request.texts]
+        try:
+            vectors = self._send(texts)
+            offset = 0
+            for request in batch:
+                request.vectors = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def get_stats(self) -> Dict:
+        """
+        Retourne les statistiques de regroupement (appels reçus, lots envoyés)
+        """
+        with self._condition:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+        stats["avg_batch_texts"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
@@ -0,0 +1,163 @@
+# retriever/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from retriever.embedding_batcher import EmbeddingBatcher
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, db_path: str = ".embedding_cache.sqlite3",
+                 model: Optional[str] = None, batch_size: int = 256):
+        """
+        Couche de cache persistante devant un modèle d'embeddings.
+        Clé : (modèle, hash du texte). Stockage : SQLite local.
+        Les textes absents du cache sont envoyés au modèle par lots.
+        """
+        self.underlying = underlying
+        self.db_path = db_path
+        self.model = model or getattr(underlying, "model", "unknown")
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "requests": 0}
+        self._init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par thread : sqlite3 ne partage pas ses connexions entre threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Récupère les vecteurs déjà en cache pour une liste de hashes
+        """
+        found = {}
+        conn = self._connection()
+        # Limite du nombre de paramètres SQLite par requête
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model, *part]
+            )
+            for text_hash, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[text_hash] = vector.tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        conn = self._connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+            [(self.model, text_hash, array("f", vector).tobytes()) for text_hash, vector in items.items()]
+        )
+        conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Retourne les embeddings des textes, en n'appelant le modèle que pour les absents du cache
+        """
+        hashes = [self._hash(text) for text in texts]
+        cached = self._lookup(list(set(hashes)))
+
+        # Déduplication : un même texte n'est envoyé qu'une fois
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[start:start + self.batch_size]
+            vectors = self.underlying.embed_documents([text for _, text in batch])
+            computed = {text_hash: vector for (text_hash, _), vector in zip(batch, vectors)}
+            self._store(computed)
+            cached.update(computed)
+            with self._stats_lock:
+                self.stats["requests"] += 1
+
+        with self._stats_lock:
+            self.stats["misses"] += len(missing)
+            self.stats["hits"] += len(texts) - len(missing)
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def get_stats(self) -> Dict:
+        """
+        Retourne les statistiques du cache d'embeddings
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["model"] = self.model
+        return stats
+
+
+_shared_embeddings = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_embeddings() -> CachedEmbeddings:
+    """
+    Retourne l'instance d'embeddings partagée par les documents, la mémoire et le retriever
+    """
+    global _shared_embeddings
+    with _shared_lock:
+        if _shared_embeddings is None:
+            # EMBEDDINGS_BASE_URL permet de viser un serveur d'embeddings local (tests) :
+            # les textes lui sont alors envoyés bruts, sans découpage en tokens tiktoken
+            base_url = os.getenv("EMBEDDINGS_BASE_URL") or None
+            provider = OpenAIEmbeddings(
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                openai_api_base=base_url,
+                check_embedding_ctx_length=base_url is None
+            )
+            # Les absents du cache passent par le regroupeur de requêtes
+            batcher = EmbeddingBatcher(
+                provider,
+                window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")),
+                max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH", "256")),
+                max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),
+                requests_per_second=float(os.getenv("EMBEDDING_RATE_LIMIT", "0"))
+            )
+            _shared_embeddings = CachedEmbeddings(
+                batcher,
+                db_path=os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+            )
+        return _shared_embeddings
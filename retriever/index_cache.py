@@ -0,0 +1,189 @@
+# retriever/index_cache.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain.vectorstores import FAISS
+from langchain.schema import Document
+
+
+class DocumentIndexCache:
+    def __init__(self, cache_dir: str = ".index_cache", max_size_mb: float = 500):
+        """
+        Cache disque des index FAISS, adressé par le contenu du fichier.
+        Chaque entrée contient l'index FAISS et les chunks extraits.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """
+        Calcule le hash SHA-256 du contenu d'un fichier
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, chunk_size: int, chunk_overlap: int, embedding_model: str) -> str:
+        """
+        Construit la clé de cache : hash du contenu + paramètres de découpage et d'embedding
+        """
+        params = f"{content_hash}|{chunk_size}|{chunk_overlap}|{embedding_model}"
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def load(self, key: str, embeddings) -> Optional[FAISS]:
+        """
+        Charge un index depuis le cache, ou None si absent
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(entry_dir, "meta.json")):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        try:
+            # L'index a été écrit par ce cache : la désérialisation est sûre
+            vectorstore = FAISS.load_local(
+                entry_dir,
+                embeddings,
+                allow_dangerous_deserialization=True
+            )
+        except Exception as e:
+            print(f"Entrée de cache illisible ({key[:12]}) : {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        # Met à jour la date d'accès pour l'éviction LRU
+        os.utime(entry_dir, None)
+        with self._lock:
+            self.stats["hits"] += 1
+        return vectorstore
+
+    def load_chunks(self, key: str) -> List[Document]:
+        """
+        Retourne les chunks extraits stockés dans une entrée du cache
+        """
+        chunks_file = os.path.join(self.cache_dir, key, "chunks.json")
+        if not os.path.exists(chunks_file):
+            return []
+        with open(chunks_file, "r", encoding="utf-8") as f:
+            return [Document(page_content=c["page_content"], metadata=c["metadata"]) for c in json.load(f)]
+
+    def store(self, key: str, vectorstore: FAISS, documents: Optional[List[Document]], source: str):
+        """
+        Enregistre un index et ses chunks dans le cache puis applique l'éviction.
+        Sans liste de documents, les chunks sont relus depuis le docstore de l'index, dans l'ordre de l'index.
+        """
+        if documents is None:
+            documents = [vectorstore.docstore.search(doc_id)
+                         for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            vectorstore.save_local(tmp_dir)
+
+            with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(
+                    [{"page_content": d.page_content, "metadata": d.metadata} for d in documents],
+                    f,
+                    ensure_ascii=False
+                )
+
+            # meta.json est écrit en dernier : sa présence marque une entrée complète
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "source": source,
+                    "chunks": len(documents),
+                    "created": time.time()
+                }, f, ensure_ascii=False)
+
+            if os.path.exists(entry_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            else:
+                os.replace(tmp_dir, entry_dir)
+
+            with self._lock:
+                self.stats["stores"] += 1
+
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du cache d'index : {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self._evict()
+
+    def _entry_size(self, entry_dir: str) -> int:
+        size = 0
+        for root, _, files in os.walk(entry_dir):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return size
+
+    def _list_entries(self) -> List[Dict]:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if ".tmp-" in name or not os.path.isdir(entry_dir):
+                continue
+            entries.append({
+                "key": name,
+                "path": entry_dir,
+                "size": self._entry_size(entry_dir),
+                "last_access": os.path.getmtime(entry_dir)
+            })
+        return entries
+
+    def _evict(self):
+        """
+        Supprime les entrées les moins récemment utilisées au-delà de la taille maximale
+        """
+        with self._lock:
+            entries = sorted(self._list_entries(), key=lambda e: e["last_access"])
+            total = sum(e["size"] for e in entries)
+
+            # On conserve toujours au moins l'entrée la plus récente
+            while total > self.max_size_bytes and len(entries) > 1:
+                oldest = entries.pop(0)
+                shutil.rmtree(oldest["path"], ignore_errors=True)
+                total -= oldest["size"]
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict:
+        """
+        Retourne les statistiques du cache (hits, misses, taille disque)
+        """
+        with self._lock:
+            entries = self._list_entries()
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(entries)
+        stats["size_bytes"] = sum(e["size"] for e in entries)
+        stats["max_size_bytes"] = self.max_size_bytes
+        return stats
+
+    def clear(self):
+        """
+        Vide entièrement le cache
+        """
+        with self._lock:
+            for entry in self._list_entries():
+                shutil.rmtree(entry["path"], ignore_errors=True)
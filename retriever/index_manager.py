@@ -1,12 +1,11 @@
 # retriever/index_manager.py
-import os
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from retriever.embedding_cache import get_shared_embeddings
 
 class PDFRetriever:
     def __init__(self, file_path):
         self.file_path = file_path
-        self.embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        self.embeddings = get_shared_embeddings()
         self.vectordb = None
 
     def build_index(self, docs):
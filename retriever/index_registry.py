@@ -0,0 +1,151 @@
+# retriever/index_registry.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain.vectorstores import FAISS
+
+
+class DocumentIndexRegistry:
+    def __init__(self, max_memory_mb: float = 512, max_documents: Optional[int] = None):
+        """
+        Registre des index de documents résidents en mémoire.
+        Éviction LRU dès que le budget mémoire (ou le nombre max de documents) est dépassé.
+        """
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.max_documents = max_documents
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_size(vectorstore: FAISS) -> int:
+        """
+        Estime l'empreinte mémoire d'un index FAISS (vecteurs + texte des chunks)
+        """
+        index = vectorstore.index
+        size = index.ntotal * index.d * 4
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            if hasattr(doc, "page_content"):
+                size += len(doc.page_content.encode("utf-8"))
+        return size
+
+    def register(self, key: str, vectorstore: FAISS, file_path: str, content_hash: str,
+                 status: str = "ready") -> Dict:
+        """
+        Ajoute (ou remplace) un index dans le registre et applique l'éviction.
+        Le verrou de l'entrée protège l'index pendant une indexation en cours.
+        """
+        entry = {
+            "key": key,
+            "vectorstore": vectorstore,
+            "path": os.path.abspath(file_path),
+            "content_hash": content_hash,
+            "chunks": len(vectorstore.index_to_docstore_id),
+            "size_bytes": self.estimate_size(vectorstore),
+            "status": status,
+            "lock": threading.Lock(),
+            "loaded_at": time.time(),
+            "last_used": time.time()
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        return entry
+
+    def get(self, path_or_hash: str) -> Optional[Dict]:
+        """
+        Retrouve un index chargé par clé, hash du contenu ou chemin du fichier
+        """
+        with self._lock:
+            entry = self._find(path_or_hash)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(entry["key"])
+            return entry
+
+    def _find(self, path_or_hash: str) -> Optional[Dict]:
+        if path_or_hash in self._entries:
+            return self._entries[path_or_hash]
+
+        abs_path = os.path.abspath(path_or_hash)
+        # Le document le plus récemment utilisé est prioritaire pour un même chemin
+        for entry in reversed(self._entries.values()):
+            if entry["content_hash"] == path_or_hash or entry["path"] == abs_path:
+                return entry
+        return None
+
+    def update(self, key: str, **fields):
+        """
+        Met à jour les champs d'une entrée (statut, nombre de chunks...)
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries[key].update(fields)
+
+    def refresh(self, key: str):
+        """
+        Recalcule la taille d'une entrée après ajout de chunks, puis applique l'éviction
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            with entry["lock"]:
+                entry["chunks"] = len(entry["vectorstore"].index_to_docstore_id)
+                entry["size_bytes"] = self.estimate_size(entry["vectorstore"])
+            self._evict(keep=key)
+
+    def remove(self, path_or_hash: str) -> bool:
+        """
+        Décharge un document du registre
+        """
+        with self._lock:
+            entry = self._find(path_or_hash)
+            if entry is None:
+                return False
+            del self._entries[entry["key"]]
+            return True
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Évince les index les moins récemment utilisés au-delà du budget.
+        Un index en cours d'ingestion est épinglé : ni évincé, ni compté dans le budget
+        avant la fin de son ingestion (le registre le recompte alors via refresh).
+        """
+        counted = [key for key, entry in self._entries.items() if entry["status"] != "ingesting"]
+        usage = sum(self._entries[key]["size_bytes"] for key in counted)
+        evictable = [key for key in counted if key != keep]
+
+        for key in evictable:
+            over_memory = usage > self.max_memory_bytes
+            over_count = self.max_documents is not None and len(counted) > self.max_documents
+            if not (over_memory or over_count):
+                break
+            usage -= self._entries.pop(key)["size_bytes"]
+            counted.remove(key)
+            self.evictions += 1
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(e["size_bytes"] for e in self._entries.values())
+
+    def list_documents(self) -> List[Dict]:
+        """
+        Liste les documents chargés, du moins au plus récemment utilisé
+        """
+        with self._lock:
+            return [
+                {k: v for k, v in entry.items() if k not in ("vectorstore", "lock")}
+                for entry in self._entries.values()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
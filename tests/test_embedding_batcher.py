@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from typing import List
+
+import pytest
+import requests
+from langchain.embeddings.base import Embeddings
+
+from retriever.embedding_batcher import EmbeddingBatcher
+
+
+class HTTPEmbeddings(Embeddings):
+    """
+    Fournisseur d'embeddings minimal : une requête HTTP par appel, tous les textes dans la même requête
+    """
+    def __init__(self, url: str):
+        self.url = url
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = requests.post(self.url, json={"input": texts}, timeout=5)
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def embeddings_route(delay: float = 0.0):
+    # Vecteur déterminé par le texte : chaque appelant peut vérifier qu'il reçoit les siens
+    def route(path, body):
+        time.sleep(delay)
+        texts = json.loads(body)["input"]
+        data = [{"index": i, "embedding": [float(len(text)), 1.0]} for i, text in enumerate(texts)]
+        return 200, {"Content-Type": "application/json"}, json.dumps({"data": data}).encode("utf-8")
+    return route
+
+
+@pytest.fixture
+def provider(stub_server):
+    stub_server.routes["/embeddings"] = embeddings_route()
+    return HTTPEmbeddings(stub_server.url("/embeddings"))
+
+
+def run_concurrently(batcher: EmbeddingBatcher, calls: List[List[str]]) -> List[List[List[float]]]:
+    results = [None] * len(calls)
+    start = threading.Barrier(len(calls))
+
+    def call(i):
+        start.wait()
+        results[i] = batcher.embed_documents(calls[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_request(stub_server, provider):
+    batcher = EmbeddingBatcher(provider, window_ms=100)
+    calls = [["x" * (i + 1)] for i in range(8)]
+    results = run_concurrently(batcher, calls)
+
+    assert len(stub_server.requests) == 1
+    assert [vectors[0][0] for vectors in results] == [float(i + 1) for i in range(8)]
+    assert batcher.get_stats()["batches"] == 1
+
+
+def test_single_call_is_sent_when_the_window_closes(stub_server, provider):
+    batcher = EmbeddingBatcher(provider, window_ms=150)
+    start = time.perf_counter()
+    assert batcher.embed_query("abc") == [3.0, 1.0]
+    elapsed = time.perf_counter() - start
+    assert 0.15 <= elapsed < 1
+
+
+def test_full_batch_is_sent_before_the_window_closes(stub_server, provider):
+    batcher = EmbeddingBatcher(provider, window_ms=5000, max_batch_size=4)
+    start = time.perf_counter()
+    run_concurrently(batcher, [["a"], ["bb"], ["ccc"], ["dddd"]])
+    assert time.perf_counter() - start < 1
+    assert len(stub_server.requests) == 1
+
+
+def test_large_calls_bypass_the_window(stub_server, provider):
+    batcher = EmbeddingBatcher(provider, window_ms=5000, max_batch_size=2)
+    start = time.perf_counter()
+    assert len(batcher.embed_documents(["a", "b", "c"])) == 3
+    assert time.perf_counter() - start < 1
+
+
+def test_requests_are_rate_limited(stub_server, provider):
+    # 2 requêtes par seconde, rafale de 2 : les deux suivantes attendent chacune 0,5 s
+    batcher = EmbeddingBatcher(provider, max_batch_size=1, requests_per_second=2)
+    start = time.perf_counter()
+    for text in ["a", "b", "c", "d"]:
+        batcher.embed_documents([text])
+    assert time.perf_counter() - start >= 0.9
+    assert len(stub_server.requests) == 4
+
+
+def test_concurrent_requests_are_bounded(stub_server):
+    stub_server.routes["/slow"] = embeddings_route(delay=0.2)
+    batcher = EmbeddingBatcher(HTTPEmbeddings(stub_server.url("/slow")), max_batch_size=1, max_concurrency=2)
+    run_concurrently(batcher, [["t"]] * 6)
+    assert len(stub_server.requests) == 6
+    assert stub_server.max_active == 2
+
+
+def test_provider_errors_reach_every_caller_of_the_batch(stub_server):
+    batcher = EmbeddingBatcher(HTTPEmbeddings(stub_server.url("/absent")), window_ms=50)
+    with pytest.raises(requests.HTTPError):
+        batcher.embed_query("abc")
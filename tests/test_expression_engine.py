@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from tools.calculator_tool import CalculatorTool, format_number
+from tools.expression_engine import ExpressionEngine, ExpressionError, ExpressionTooExpensive
+
+
+@pytest.fixture
+def engine():
+    return ExpressionEngine()
+
+
+@pytest.mark.parametrize("expression", [
+    "9**9**9",
+    "pow(10, 10**9)",
+    "(10**300000) * (10**300000) * (10**300000) * (10**300000)",
+])
+def test_expensive_integer_results_are_refused_before_computing(engine, expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionTooExpensive):
+        engine.evaluate(expression)
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize("expression", ["round(1, -10**7)", "round(1, -3*10**7)", "round(2.5, 10**9)"])
+def test_round_with_huge_ndigits_is_refused(engine, expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionError):
+        engine.evaluate(expression)
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("round(2.567, 2)", 2.57),
+    ("round(1234, -2)", 1200),
+    ("round(2.5)", 2),
+    ("pow(2, 10)", 1024),
+    ("pow(2, 10**9, 7)", 2),
+    ("3 * 4 ** 2", 48),
+    ("abs(-3) + floor(2.7) + ceil(2.3)", 8),
+])
+def test_guarded_functions_keep_builtin_results(engine, expression, expected):
+    assert engine.evaluate(expression) == expected
+
+
+@pytest.mark.parametrize("expression", ["sqrt(10**300000)", "exp(10**6)", "10**300000 / 3", "log(10**300000)"])
+def test_math_functions_on_huge_values_stay_cheap(engine, expression):
+    start = time.perf_counter()
+    try:
+        engine.evaluate(expression)
+    except (OverflowError, ValueError):
+        pass
+    assert time.perf_counter() - start < 1
+
+
+def test_calculator_reports_round_limit():
+    calculator = CalculatorTool(isolation=False)
+    start = time.perf_counter()
+    output = calculator.calculate("round(1, -10**7)")
+    assert output.startswith("❌")
+    assert time.perf_counter() - start < 1
+
+
+def test_vectorized_round_and_products():
+    calculator = CalculatorTool(isolation=False)
+    output = calculator.calculate("round(x * 1.234, 1) ; x=[1, 2]")
+    assert "1.2" in output and "2.5" in output
+
+
+@pytest.mark.parametrize("expression", ["pow(3, 10**3000, 10**3000 + 7)", "pow(3, 10**6000, 10**6000 + 7)"])
+def test_expensive_modular_power_is_refused_inline(engine, expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionTooExpensive):
+        engine.evaluate(expression)
+    assert time.perf_counter() - start < 1
+
+
+def test_calculator_refuses_modular_power_beyond_worker_limit():
+    calculator = CalculatorTool(isolation=False)
+    start = time.perf_counter()
+    output = calculator.calculate("pow(3, 10**6000, 10**6000 + 7)")
+    assert output.startswith("❌") and "puissance modulaire" in output
+    assert time.perf_counter() - start < 1
+
+
+def test_small_modular_power_is_computed(engine):
+    assert engine.evaluate("pow(3, 10**100, 10**20 + 7)") == pow(3, 10**100, 10**20 + 7)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (10**10**5 + 1, "1e+100000 (100001 chiffres)"),
+    (3**50000, "1.15540963049059e+23856 (23857 chiffres)"),
+    (10**5000, "1e+5000 (5001 chiffres)"),
+    (10**5000 - 1, "1e+5000 (5000 chiffres)"),
+    (-(2**40000), "-1.58426037257308e+12041 (12042 chiffres)"),
+], ids=["10**10**5+1", "3**50000", "10**5000", "10**5000-1", "-2**40000"])
+def test_huge_integers_are_summarized_with_exact_digits(value, expected):
+    assert format_number(value) == expected
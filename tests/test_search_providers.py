@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from tools.search_providers import (DuckDuckGoProvider, HedgedSearchEngine, SearchCancelled, SearchProvider,
+                                    SerperProvider)
+
+DDG_PAGE = (
+    '<div class="result"><a class="result__a" href="https://exemple.fr/a">Titre A</a>'
+    '<a class="result__snippet">Extrait A</a></div>'
+)
+
+
+def html_results(delay: float = 0.0):
+    def route(path, body):
+        time.sleep(delay)
+        return 200, {"Content-Type": "text/html"}, DDG_PAGE.encode("utf-8")
+    return route
+
+
+def serper_results(path, body):
+    organic = [{"title": "Titre S", "snippet": "Extrait S", "link": "https://exemple.fr/s"}]
+    return 200, {"Content-Type": "application/json"}, json.dumps({"organic": organic}).encode("utf-8")
+
+
+class FakeDDGS:
+    """
+    Client DDGS de substitution : enregistre le délai reçu, peut simuler un abandon pendant l'appel
+    """
+    def __init__(self, during_call=None):
+        self.timeout = 10
+        self.seen_timeout = None
+        self.during_call = during_call
+
+    def text(self, query, max_results=5):
+        self.seen_timeout = self.timeout
+        if self.during_call:
+            self.during_call()
+        return [{"title": "Titre D", "body": "Extrait D", "href": "https://exemple.fr/d"}]
+
+
+def test_search_provider_is_abstract():
+    with pytest.raises(TypeError):
+        SearchProvider()
+
+
+def test_duckduckgo_endpoint_results_are_parsed(stub_server):
+    stub_server.routes["/html"] = html_results()
+    results = DuckDuckGoProvider(endpoint=stub_server.url("/html")).search("requête")
+    assert results == [{"title": "Titre A", "body": "Extrait A", "href": "https://exemple.fr/a"}]
+    assert stub_server.requests[0][2] == b"q=requ%C3%AAte"
+
+
+def test_request_timeout_is_bounded_by_deadline(stub_server):
+    stub_server.routes["/html"] = html_results(delay=2)
+    provider = DuckDuckGoProvider(timeout=5, endpoint=stub_server.url("/html"))
+    start = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        provider.search("requête", deadline=time.monotonic() + 0.3)
+    assert time.perf_counter() - start < 1
+
+
+def test_slow_provider_is_hedged_then_abandoned(stub_server):
+    stub_server.routes["/html"] = html_results(delay=1.5)
+    stub_server.routes["/serper"] = serper_results
+    engine = HedgedSearchEngine([
+        DuckDuckGoProvider(timeout=3, endpoint=stub_server.url("/html")),
+        SerperProvider("clé", timeout=3, endpoint=stub_server.url("/serper")),
+    ], hedge_after=0.2)
+
+    start = time.perf_counter()
+    name, results = engine.search("requête")
+    assert time.perf_counter() - start < 1
+    assert name == "serper" and results[0]["href"] == "https://exemple.fr/s"
+    stats = engine.get_stats()
+    assert stats["hedged"] == 1 and stats["abandoned"] == 1
+
+
+def test_all_providers_timing_out_raise_within_their_delay(stub_server):
+    stub_server.routes["/html"] = html_results(delay=2)
+    engine = HedgedSearchEngine([DuckDuckGoProvider(timeout=0.3, endpoint=stub_server.url("/html"))])
+    start = time.perf_counter()
+    with pytest.raises(Exception):
+        engine.search("requête")
+    assert time.perf_counter() - start < 1
+
+
+def test_ddgs_client_gets_remaining_time():
+    provider = DuckDuckGoProvider(timeout=5)
+    client = provider._local.ddgs = FakeDDGS()
+    results = provider.search("requête", deadline=time.monotonic() + 0.5)
+    assert results[0]["title"] == "Titre D"
+    assert client.seen_timeout <= 0.5
+
+
+def test_ddgs_results_are_dropped_once_cancelled():
+    provider = DuckDuckGoProvider(timeout=5)
+    cancelled = threading.Event()
+    provider._local.ddgs = FakeDDGS(during_call=cancelled.set)
+    with pytest.raises(SearchCancelled):
+        provider.search("requête", cancelled=cancelled, deadline=time.monotonic() + 5)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+from langchain.embeddings import DeterministicFakeEmbedding
+
+from retriever import embedding_cache
+from tools.web_reader import WebPageReader
+
+ARTICLE = (
+    "<html><head><title>{title}</title></head><body><nav>Menu Accueil Contact</nav>"
+    "<main><p>{text}</p></main><footer>Mentions légales</footer></body></html>"
+)
+
+
+def page(title: str, text: str, delay: float = 0.0, content_type: str = "text/html; charset=utf-8"):
+    def route(path, body):
+        time.sleep(delay)
+        return 200, {"Content-Type": content_type}, ARTICLE.format(title=title, text=text).encode("utf-8")
+    return route
+
+
+def words(prefix: str, n: int = 80) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    # Lecteur sans fournisseur d'embeddings distant : vecteurs déterministes calculés localement
+    monkeypatch.setattr(embedding_cache, "_shared_embeddings", DeterministicFakeEmbedding(size=32))
+    return WebPageReader(timeout=3, per_host=2)
+
+
+def test_main_text_is_extracted(stub_server, reader):
+    stub_server.routes["/article"] = page("Titre", words("mot"))
+    pages = asyncio.run(reader.fetch_all([stub_server.url("/article")]))
+    assert pages[0]["title"] == "Titre"
+    assert pages[0]["text"].startswith("mot0 mot1")
+    assert "Menu" not in pages[0]["text"] and "Mentions" not in pages[0]["text"]
+
+
+def test_connections_per_host_are_bounded(stub_server, reader):
+    urls = []
+    for i in range(6):
+        stub_server.routes[f"/p{i}"] = page(f"Page {i}", words(f"p{i}-"), delay=0.2)
+        urls.append(stub_server.url(f"/p{i}"))
+    pages = asyncio.run(reader.fetch_all(urls))
+    assert len(pages) == 6
+    assert stub_server.max_active == 2
+
+
+def test_pages_are_truncated_at_max_bytes(stub_server, reader):
+    reader.max_bytes = 100_000
+    stub_server.routes["/long"] = page("Long", "x " * 200_000, content_type="text/plain")
+    pages = asyncio.run(reader.fetch_all([stub_server.url("/long")]))
+    assert pages[0]["truncated"]
+    assert len(pages[0]["text"]) <= 100_000
+    assert reader.stats["truncated"] == 1
+
+
+def test_duplicate_urls_and_near_duplicate_pages_are_dropped(stub_server, reader):
+    stub_server.routes["/a"] = page("A", words("commun"))
+    stub_server.routes["/b"] = page("B", words("commun") + " fin")
+    stub_server.routes["/c"] = page("C", words("autre"))
+    urls = [stub_server.url("/a"), stub_server.url("/a#section"), stub_server.url("/b"), stub_server.url("/c")]
+
+    pages = reader.deduplicate(asyncio.run(reader.fetch_all(urls)))
+    assert [p["title"] for p in pages] == ["A", "C"]
+    assert len(stub_server.requests) == 3
+    assert reader.stats["duplicates"] == 1
+
+
+def test_failed_pages_are_skipped(stub_server, reader):
+    stub_server.routes["/ok"] = page("OK", words("mot"))
+    pages = asyncio.run(reader.fetch_all([stub_server.url("/absent"), stub_server.url("/ok")]))
+    assert [p["title"] for p in pages] == ["OK"]
+    assert reader.stats["failed"] == 1
+
+
+def test_read_urls_works_inside_a_running_event_loop(stub_server, reader):
+    stub_server.routes["/article"] = page("Titre", words("mot"))
+
+    async def handler():
+        return reader.read_urls([stub_server.url("/article")], "mot1", k=2)
+
+    passages = asyncio.run(handler())
+    assert passages and passages[0].metadata["source"] == stub_server.url("/article")
@@ -1,55 +1,169 @@
-import math
 import re
-from typing import Union
+from decimal import Decimal, localcontext
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from tools.calculator_worker import IsolatedEvaluator
+from tools.expression_engine import (SAFE_CONSTANTS, SAFE_FUNCTIONS, ExpressionEngine, ExpressionError,
+                                     ExpressionTooExpensive)
+
+# Séparateur d'affectations : virgule suivie de "nom =" (les listes [1, 2, 3] contiennent aussi des virgules)
+ASSIGNMENT_SEPARATOR = re.compile(r",\s*(?=[A-Za-z_]\w*\s*=)")
+# Intervalle "début..fin" (pas de 1) ou "début..fin:n" (n points régulièrement espacés)
+RANGE_PATTERN = re.compile(r"^(?P<start>.+?)\.\.(?P<stop>[^:]+?)(?::(?P<count>.+))?$")
+
+def format_number(value) -> str:
+    """
+    Affichage d'un résultat ; les très grands entiers sont résumés (mantisse, nombre de chiffres)
+    plutôt que convertis en texte intégralement
+    """
+    if isinstance(value, int) and value.bit_length() > 10_000:
+        # Mantisse tirée des 128 bits de tête en précision décimale étendue :
+        # un log10 en flottant fausse les chiffres au-delà du huitième pour ces ordres de grandeur
+        magnitude = abs(value)
+        shift = magnitude.bit_length() - 128
+        leading = magnitude >> shift
+        with localcontext() as context:
+            context.prec = 50
+            log10_2 = Decimal(2).log10()
+            log10 = Decimal(leading).log10() + shift * log10_2
+            exponent = int(log10)
+            if int(Decimal(leading + 1).log10() + shift * log10_2) > exponent and magnitude >= 10 ** (exponent + 1):
+                # Valeur à la frontière d'une puissance de 10 : comparaison exacte
+                exponent += 1
+                log10 = Decimal(exponent)
+            mantissa = round(Decimal(10) ** (log10 - exponent), 14)
+        digits = exponent + 1
+        if mantissa >= 10:
+            mantissa, exponent = mantissa / 10, exponent + 1
+        sign = "-" if value < 0 else ""
+        return f"{sign}{mantissa.normalize():f}e+{exponent} ({digits} chiffres)"
+    return str(value)
 
 class CalculatorTool:
-    def __init__(self):
+    def __init__(self, cache_size: int = 512, max_points: int = 1_000_000, preview_rows: int = 5,
+                 inline_pow_bits: float = 1_000_000, isolated: Optional[IsolatedEvaluator] = None,
+                 isolation: bool = True):
         # Fonctions mathématiques sûres
-        self.safe_functions = {
-            'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
-            'asin': math.asin, 'acos': math.acos, 'atan': math.atan,
-            'log': math.log, 'log10': math.log10, 'ln': math.log,
-            'sqrt': math.sqrt, 'abs': abs, 'ceil': math.ceil,
-            'floor': math.floor, 'round': round, 'pi': math.pi,
-            'e': math.e, 'exp': math.exp, 'pow': pow
-        }
-    
+        self.safe_functions = {**SAFE_FUNCTIONS, **SAFE_CONSTANTS}
+        # Expressions analysées, validées et compilées une seule fois (cache par texte normalisé).
+        # Au-delà de inline_pow_bits, une puissance n'est pas calculée dans ce processus.
+        self.engine = ExpressionEngine(SAFE_FUNCTIONS, SAFE_CONSTANTS, cache_size=cache_size,
+                                       max_pow_bits=inline_pow_bits)
+        # Calculs lourds : processus séparé, temps CPU et mémoire plafonnés (sinon refusés)
+        self.isolated = isolated or (IsolatedEvaluator() if isolation else None)
+        # Mode tableau : nombre maximal de valeurs, lignes affichées en tête et en fin
+        self.max_points = max_points
+        self.preview_rows = preview_rows
+
+    def _parse_value(self, value: str):
+        """
+        Valeur d'une variable : expression constante, liste [a, b, ...] ou intervalle a..b / a..b:n
+        """
+        value = value.strip()
+        if value.startswith("[") and value.endswith("]"):
+            items = [item for item in value[1:-1].split(",") if item.strip()]
+            if not items:
+                raise ExpressionError("liste vide")
+            return np.array([self.engine.evaluate(item) for item in items], dtype=np.float64)
+
+        match = RANGE_PATTERN.match(value)
+        if match:
+            start = self.engine.evaluate(match["start"])
+            stop = self.engine.evaluate(match["stop"])
+            count = int(abs(stop - start)) + 1 if match["count"] is None else int(self.engine.evaluate(match["count"]))
+            if count < 1:
+                raise ExpressionError("nombre de points invalide")
+            if count > self.max_points:
+                raise ExpressionError(f"trop de valeurs ({count} > {self.max_points})")
+            if match["count"] is None:
+                values = start + (1 if stop >= start else -1) * np.arange(count, dtype=np.float64)
+            else:
+                values = np.linspace(start, stop, count)
+            return values
+
+        return self.engine.evaluate(value)
+
+    def _parse_input(self, text: str) -> Tuple[str, Dict]:
+        """
+        "expression ; x=1, y=2" -> (expression, valeurs des variables)
+        Les valeurs peuvent elles-mêmes être des expressions constantes (ex. x=pi/4),
+        des listes (x=[1, 2, 5]) ou des intervalles (x=1..40, x=0..2*pi:10000).
+        """
+        expression, _, assignments = text.partition(";")
+        values = {}
+        for assignment in ASSIGNMENT_SEPARATOR.split(assignments):
+            if not assignment.strip():
+                continue
+            name, sep, value = assignment.partition("=")
+            name = name.strip()
+            if not sep or not name.isidentifier():
+                raise ExpressionError(f"affectation invalide : {assignment.strip()}")
+            values[name] = self._parse_value(value)
+        return expression.strip(), values
+
     def calculate(self, expression: str) -> str:
         """
-        Effectue des calculs mathématiques sécurisés
+        Effectue des calculs mathématiques sécurisés.
+        Variables possibles après un point-virgule : "x**2 + y ; x=3, y=4".
+        Une variable liée à une liste ou un intervalle déclenche le calcul vectorisé (NumPy).
         """
         try:
-            # Nettoyage de l'expression
-            expression = expression.strip()
-            
-            # Remplacement des fonctions
-            for func_name, func in self.safe_functions.items():
-                if isinstance(func, (int, float)):  # Constantes
-                    expression = expression.replace(func_name, str(func))
-                else:  # Fonctions
-                    expression = re.sub(
-                        rf'\b{func_name}\s*\(',
-                        f'self.safe_functions["{func_name}"](',
-                        expression
-                    )
-            
-            # Évaluation sécurisée
-            # On utilise eval mais avec un environnement restreint
-            allowed_names = {
-                "__builtins__": {},
-                "self": self,
-                **self.safe_functions
-            }
+            expression, values = self._parse_input(expression)
+            compiled = self.engine.compile(expression)
+            if any(isinstance(value, np.ndarray) for value in values.values()):
+                return self._calculate_batch(compiled, values)
+            try:
+                result = compiled(**values)
+            except ExpressionTooExpensive as e:
+                # Trop lourd pour le processus courant : calcul isolé si la taille estimée reste acceptable
+                if self.isolated is None or e.bits > self.isolated.max_pow_bits:
+                    raise
+                result = self.isolated.evaluate(compiled.source, values)
             
-            result = eval(expression, allowed_names)
-            
-            return f"🧮 Calcul: {expression}\n📊 Résultat: {result}"
+            return f"🧮 Calcul: {compiled.source}\n📊 Résultat: {format_number(result)}"
             
         except ZeroDivisionError:
             return "❌ Erreur: Division par zéro"
+        except ExpressionTooExpensive as e:
+            return f"❌ Erreur: {str(e)}"
+        except ExpressionError as e:
+            return f"❌ Erreur: Expression mathématique invalide ({str(e)})"
         except ValueError as e:
             return f"❌ Erreur de valeur: {str(e)}"
-        except SyntaxError:
-            return "❌ Erreur: Expression mathématique invalide"
         except Exception as e:
-            return f"❌ Erreur de calcul: {str(e)}"
\ No newline at end of file
+            return f"❌ Erreur de calcul: {str(e)}"
+
+    def _calculate_batch(self, compiled, values: Dict) -> str:
+        """
+        Évaluation vectorisée en une passe ; sortie résumée (premières et dernières lignes, agrégats)
+        pour ne pas inonder le prompt
+        """
+        arrays = {name: value for name, value in values.items() if isinstance(value, np.ndarray)}
+        lengths = {len(array) for array in arrays.values()}
+        if len(lengths) > 1:
+            raise ExpressionError("les listes et intervalles doivent avoir la même longueur")
+        size = lengths.pop()
+        result = np.broadcast_to(compiled.vectorized(**values), (size,))
+
+        def row(i: int) -> str:
+            bound = ", ".join(f"{name}={array[i]:g}" for name, array in arrays.items())
+            return f"   {bound} → {result[i]:.10g}"
+
+        n = self.preview_rows
+        indexes = list(range(size)) if size <= 2 * n else list(range(n)) + [None] + list(range(size - n, size))
+        lines = [row(i) if i is not None else "   ..." for i in indexes]
+
+        finite = result[np.isfinite(result)]
+        output = f"🧮 Calcul vectorisé: {compiled.source} ({size} valeurs)\n📊 Résultats:\n" + "\n".join(lines)
+        if finite.size:
+            output += (f"\n📈 Min: {finite.min():.10g} | Max: {finite.max():.10g} | "
+                       f"Moyenne: {finite.mean():.10g} | Somme: {finite.sum():.10g}")
+        if finite.size < size:
+            output += f"\n⚠️ {size - finite.size} valeur(s) hors domaine (nan/inf)"
+        return output
+
+    def close(self):
+        if self.isolated is not None:
+            self.isolated.close()
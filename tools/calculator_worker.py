@@ -0,0 +1,156 @@
+import math
+import os
+import threading
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows : pas de limites par processus, seul le délai s'applique
+    resource = None
+
+from tools.expression_engine import ExpressionEngine, ExpressionTooExpensive
+from utils.process_context import get_process_context
+
+
+def _limit_memory(memory_mb: float):
+    """
+    Plafond d'espace d'adressage : mémoire déjà réservée par le processus + memory_mb
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        current = 0
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + int(memory_mb * 1024 * 1024)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _limit_cpu(cpu_seconds: float):
+    """
+    RLIMIT_CPU est cumulatif : la limite suit le temps déjà consommé par ce processus réutilisé
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, cpu_seconds: float, memory_mb: float, max_pow_bits: float):
+    """
+    Boucle du processus de calcul : reçoit (expression, variables), renvoie ("ok", résultat) ou ("error", exception).
+    Un dépassement du temps CPU (SIGXCPU) termine le processus ; le parent le remplace.
+    """
+    if resource is not None:
+        _limit_memory(memory_mb)
+    # Moteur propre au processus (aucun verrou hérité du parent)
+    engine = ExpressionEngine(max_pow_bits=max_pow_bits)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        expression, values = request
+        if resource is not None:
+            _limit_cpu(cpu_seconds)
+        try:
+            reply = ("ok", engine.evaluate(expression, **values))
+        except MemoryError:
+            reply = ("error", ExpressionTooExpensive(math.inf))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send(("error", ValueError(f"résultat non transmissible : {e}")))
+
+
+class IsolatedEvaluator:
+    def __init__(self, cpu_seconds: float = 2.0, memory_mb: float = 256, timeout: float = 5.0,
+                 max_pow_bits: float = 100_000_000, prefork: bool = True):
+        """
+        Processus de calcul réutilisable pour les expressions lourdes : temps CPU et mémoire plafonnés,
+        délai maximal côté appelant. Le processus est démarré à l'avance (prefork) et remplacé
+        s'il est tué par un dépassement. Un seul calcul lourd à la fois.
+        """
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.timeout = timeout
+        self.max_pow_bits = max_pow_bits
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.stats = {"runs": 0, "too_expensive": 0, "restarts": 0}
+        if prefork:
+            with self._lock:
+                self._start()
+
+    def _start(self):
+        # Pas de fork depuis un thread de requête : le worker est créé par forkserver (ou spawn)
+        context = get_process_context()
+        parent_conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpu_seconds, self.memory_mb, self.max_pow_bits),
+            name="calculator-worker",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join(1)
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def evaluate(self, expression: str, values: Optional[Dict] = None):
+        """
+        Évalue l'expression dans le processus isolé ; ExpressionTooExpensive si le calcul
+        dépasse le temps CPU, la mémoire ou le délai
+        """
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                if self._process is not None:
+                    self.stats["restarts"] += 1
+                    self._stop()
+                self._start()
+            self.stats["runs"] += 1
+
+            try:
+                self._conn.send((expression, values or {}))
+                status, payload = self._conn.recv() if self._conn.poll(self.timeout) else (None, None)
+            except (EOFError, OSError):
+                # Processus tué en cours de calcul (SIGXCPU, manque de mémoire)
+                status, payload = None, None
+
+            if status is None:
+                self.stats["too_expensive"] += 1
+                self.stats["restarts"] += 1
+                self._stop()
+                self._start()
+                raise ExpressionTooExpensive(math.inf)
+
+        if status == "error":
+            if isinstance(payload, ExpressionTooExpensive):
+                with self._lock:
+                    self.stats["too_expensive"] += 1
+            raise payload
+        return payload
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        with self._lock:
+            self._stop()
@@ -1,24 +1,76 @@
 import os
+import math
 import shlex
+import threading
 import pdfplumber
-from typing import List, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.schema import Document
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
+from retriever.embedding_cache import get_shared_embeddings
+from retriever.index_cache import DocumentIndexCache
+from retriever.index_registry import DocumentIndexRegistry
+from utils.process_context import get_process_context
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    Extrait le texte des pages [start, end) d'un PDF.
+    Exécutée dans un processus séparé : retourne (numéro de page, texte, erreur).
+    """
+    results = []
+    with pdfplumber.open(file_path) as pdf:
+        for index in range(start, end):
+            page_num = index + 1
+            try:
+                results.append((page_num, pdf.pages[index].extract_text() or "", None))
+            except Exception as e:
+                results.append((page_num, "", str(e)))
+    return results
+
 
 class DocumentReaderTool:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
+    def __init__(self, cache_dir: str = ".index_cache", cache_max_size_mb: float = 500,
+                 max_resident_mb: float = 512, max_resident_documents: Optional[int] = None,
+                 parallel_extraction: bool = True, extraction_workers: Optional[int] = None,
+                 parallel_min_pages: int = 32, embedding_batch_size: int = 64,
+                 background_ingestion: bool = True):
+        # Embeddings partagés et mis en cache sur disque
+        self.embeddings = get_shared_embeddings()
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
         )
         self.vectorstore = None
         self.current_doc = None
         self.llm = ChatOpenAI(temperature=0.3)
+        # Cache disque des index, adressé par le contenu du PDF
+        self.index_cache = DocumentIndexCache(cache_dir=cache_dir, max_size_mb=cache_max_size_mb)
+        # Index résidents en mémoire (plusieurs documents à la fois, éviction LRU)
+        self.registry = DocumentIndexRegistry(
+            max_memory_mb=max_resident_mb,
+            max_documents=max_resident_documents
+        )
+        # Hash des fichiers déjà vus (LRU borné : un serveur de longue durée voit passer beaucoup de fichiers)
+        self._hash_memo: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._hash_memo_lock = threading.Lock()
+        self.hash_memo_size = 1024
+        # Extraction parallèle des pages pour les gros PDF
+        self.parallel_extraction = parallel_extraction
+        self.extraction_workers = extraction_workers or os.cpu_count() or 1
+        self.parallel_min_pages = parallel_min_pages
+        # Ingestion en flux : extraction → découpage → embedding par lots de taille fixe
+        self.embedding_batch_size = embedding_batch_size
+        self.background_ingestion = background_ingestion
+        self.pages_per_range = 16
+        self._ingest_lock = threading.Lock()
+        self._pending: Dict[str, threading.Event] = {}
 
     def read_document(self, query: str) -> str:
         """
@@ -40,23 +92,166 @@ class DocumentReaderTool:
             if not file_path.lower().endswith('.pdf'):
                 return "❌ Seuls les fichiers PDF sont supportés."
 
-            # Extraction du texte
-            text_content = self._extract_pdf_text(file_path)
-            if not text_content.strip():
+            # Chargement depuis le cache, sinon extraction et vectorisation
+            entry = self._load_or_build_index(file_path)
+            if entry is None:
                 return "❌ Le texte du PDF est vide ou non lisible."
-
-            # Création de la base vectorielle
-            documents = self._create_documents(text_content, file_path)
-            self.vectorstore = FAISS.from_documents(documents, self.embeddings)
+            # L'entrée est passée explicitement : l'outil peut être partagé entre plusieurs sessions
+            self.vectorstore = entry["vectorstore"]
             self.current_doc = file_path
 
             # Génération de la réponse
-            response = self._generate_response(question, os.path.basename(file_path))
+            response = self._generate_response(question, os.path.basename(file_path), entry)
+            if entry["status"] == "ingesting":
+                response += (f"\n⏳ Indexation en cours ({entry['chunks']} sections indexées) : "
+                             "la réponse ne porte que sur le début du document.")
             return response
 
         except Exception as e:
             return f"❌ Erreur lors de l'analyse du document : {str(e)}"
 
+    def _load_or_build_index(self, file_path: str) -> Optional[Dict]:
+        """
+        Retourne l'entrée du registre pour le document : registre mémoire, puis cache disque,
+        puis ingestion en flux
+        """
+        content_hash = self._content_hash(file_path)
+        cache_key = self.index_cache.make_key(
+            content_hash,
+            self.chunk_size,
+            self.chunk_overlap,
+            getattr(self.embeddings, "model", "unknown")
+        )
+
+        while True:
+            with self._ingest_lock:
+                entry = self.registry.get(cache_key)
+                if entry is not None:
+                    return entry
+                # Un seul chargement par document ; les autres appels attendent son premier lot
+                # sans bloquer le chargement des autres documents
+                pending = self._pending.get(cache_key)
+                if pending is None:
+                    ready = self._pending[cache_key] = threading.Event()
+            if pending is None:
+                break
+            pending.wait()
+
+        try:
+            vectorstore = self.index_cache.load(cache_key, self.embeddings)
+            if vectorstore is not None:
+                return self.registry.register(cache_key, vectorstore, file_path, content_hash)
+            return self._start_ingestion(cache_key, file_path, content_hash)
+        finally:
+            with self._ingest_lock:
+                del self._pending[cache_key]
+            ready.set()
+
+    def _start_ingestion(self, cache_key: str, file_path: str, content_hash: str) -> Optional[Dict]:
+        """
+        Lance l'ingestion du document. En mode arrière-plan, rend la main dès que
+        le premier lot est indexé : l'index est interrogeable pendant la suite de l'ingestion.
+        """
+        first_batch_ready = threading.Event()
+        state = {"entry": None, "error": None}
+
+        def run():
+            try:
+                self._ingest(cache_key, file_path, content_hash, state, first_batch_ready)
+            except Exception as e:
+                state["error"] = e
+                if state["entry"] is not None:
+                    self.registry.remove(cache_key)
+                print(f"Erreur lors de l'indexation de {os.path.basename(file_path)} : {e}")
+            finally:
+                first_batch_ready.set()
+
+        if self.background_ingestion:
+            threading.Thread(target=run, name=f"ingest-{content_hash[:8]}", daemon=True).start()
+            first_batch_ready.wait()
+        else:
+            run()
+
+        if state["error"] is not None and (state["entry"] is None or not self.background_ingestion):
+            raise state["error"]
+        return state["entry"]
+
+    def _ingest(self, cache_key: str, file_path: str, content_hash: str,
+                state: Dict, first_batch_ready: threading.Event):
+        """
+        Pipeline d'ingestion : les pages passent par le découpeur puis sont vectorisées
+        par lots, la mémoire de travail est bornée par la taille d'un lot
+        """
+        batch = []
+
+        def index_batch():
+            if state["entry"] is None:
+                vectorstore = FAISS.from_documents(batch, self.embeddings)
+                state["entry"] = self.registry.register(
+                    cache_key, vectorstore, file_path, content_hash, status="ingesting"
+                )
+                first_batch_ready.set()
+            else:
+                # Les embeddings sont calculés hors verrou, seul l'ajout à l'index est exclusif
+                embeddings = self.embeddings.embed_documents([doc.page_content for doc in batch])
+                entry = state["entry"]
+                with entry["lock"]:
+                    entry["vectorstore"].add_embeddings(
+                        [(doc.page_content, vector) for doc, vector in zip(batch, embeddings)],
+                        metadatas=[doc.metadata for doc in batch]
+                    )
+                    chunk_count = len(entry["vectorstore"].index_to_docstore_id)
+                self.registry.update(cache_key, chunks=chunk_count)
+            # Les chunks indexés ne sont conservés que dans le docstore de l'index
+            batch.clear()
+
+        for doc in self._iter_documents(self._iter_pages(file_path), file_path):
+            batch.append(doc)
+            if len(batch) >= self.embedding_batch_size:
+                index_batch()
+        if batch:
+            index_batch()
+
+        if state["entry"] is None:
+            return
+
+        self.registry.update(cache_key, status="ready")
+        self.registry.refresh(cache_key)
+        self.index_cache.store(cache_key, state["entry"]["vectorstore"], None, file_path)
+
+    def _content_hash(self, file_path: str) -> str:
+        """
+        Hash du contenu du fichier, mémorisé tant que sa taille et sa date de modification ne changent pas
+        """
+        stat = os.stat(file_path)
+        signature = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self._hash_memo_lock:
+            content_hash = self._hash_memo.get(signature)
+            if content_hash is not None:
+                self._hash_memo.move_to_end(signature)
+                return content_hash
+
+        # Lecture du fichier hors verrou
+        content_hash = self.index_cache.file_hash(file_path)
+        with self._hash_memo_lock:
+            self._hash_memo[signature] = content_hash
+            while len(self._hash_memo) > self.hash_memo_size:
+                self._hash_memo.popitem(last=False)
+        return content_hash
+
+    def resolve_document(self, message: str) -> Tuple[Optional[str], str]:
+        """
+        Repère une référence "file:chemin.pdf" dans un message.
+        Retourne (empreinte du contenu ou None, question sans la référence).
+        """
+        start = message.find("file:")
+        if start == -1:
+            return None, message
+        file_path, question = self._parse_query(message[start:])
+        if not file_path or not os.path.exists(file_path):
+            return None, message
+        return self._content_hash(file_path), (message[:start] + " " + question).strip()
+
     def _parse_query(self, query: str) -> tuple[Optional[str], str]:
         """
         Parse la requête pour extraire le chemin du fichier et la question
@@ -93,60 +288,110 @@ class DocumentReaderTool:
             
             return query_without_prefix, "Fais un résumé détaillé de ce document"
 
+    def _iter_pages(self, file_path: str) -> Iterator[Tuple[int, str, Optional[str]]]:
+        """
+        Produit les pages du PDF dans l'ordre : (numéro de page, texte, erreur).
+        Les gros documents sont extraits par plages sur un pool de processus.
+        """
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+
+        use_parallel = (
+            self.parallel_extraction
+            and self.extraction_workers > 1
+            and page_count >= self.parallel_min_pages
+        )
+
+        if not use_parallel:
+            # Réouvrir le PDF par plage libère les caches de mise en page de pdfplumber
+            for start in range(0, page_count, self.pages_per_range):
+                yield from _extract_page_range(file_path, start, min(start + self.pages_per_range, page_count))
+            return
+
+        workers = min(self.extraction_workers, page_count)
+        # Plusieurs plages par processus pour équilibrer la charge entre pages lourdes et légères
+        range_size = max(1, math.ceil(page_count / (workers * 4)))
+
+        # Pas de fork depuis un thread de requête : processus créés par forkserver (ou spawn)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_process_context()) as executor:
+            # Fenêtre glissante de plages soumises : bornée même pour de très gros PDF
+            pending = deque()
+            for start in range(0, page_count, range_size):
+                end = min(start + range_size, page_count)
+                pending.append(executor.submit(_extract_page_range, file_path, start, end))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
     def _extract_pdf_text(self, file_path: str) -> str:
         """
-        Extraction du texte d'un PDF via pdfplumber
+        Extraction du texte complet d'un PDF via pdfplumber
         """
         try:
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += f"\n--- Page {page_num} ---\n{page_text}\n"
-                    except Exception as e:
-                        print(f"Erreur sur la page {page_num}: {e}")
-                        continue
-            
-            return text.strip()
+            parts = []
+            for page_num, page_text, error in self._iter_pages(file_path):
+                if error:
+                    print(f"Erreur sur la page {page_num}: {error}")
+                    continue
+                if page_text:
+                    parts.append(f"\n--- Page {page_num} ---\n{page_text}\n")
+
+            return "".join(parts).strip()
             
         except Exception as e:
             raise Exception(f"Erreur lors de l'extraction PDF : {str(e)}")
 
-    def _create_documents(self, text: str, source: str) -> List[Document]:
-        """
-        Divise le texte en chunks pour la vectorisation
-        """
-        chunks = self.text_splitter.split_text(text)
-        documents = []
-        
-        for i, chunk in enumerate(chunks):
-            if chunk.strip():  # Ignore les chunks vides
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        "source": source,
-                        "chunk": i,
-                        "total_chunks": len(chunks)
-                    }
-                )
-                documents.append(doc)
-        
-        return documents
+    def _iter_documents(self, pages: Iterable[Tuple[int, str, Optional[str]]], source: str) -> Iterator[Document]:
+        """
+        Divise le flux de pages en chunks pour la vectorisation
+        """
+        buffer = ""
+        chunk_index = 0
+
+        def make_document(chunk: str) -> Document:
+            return Document(
+                page_content=chunk,
+                metadata={
+                    "source": source,
+                    "chunk": chunk_index
+                }
+            )
 
-    def _generate_response(self, question: str, filename: str) -> str:
+        try:
+            for page_num, page_text, error in pages:
+                if error:
+                    print(f"Erreur sur la page {page_num}: {error}")
+                    continue
+                if not page_text:
+                    continue
+
+                buffer += f"\n--- Page {page_num} ---\n{page_text}\n"
+                if len(buffer) < self.chunk_size * 4:
+                    continue
+
+                chunks = self.text_splitter.split_text(buffer)
+                # Le dernier chunk est reporté pour être complété par la page suivante
+                buffer = chunks.pop() if chunks else ""
+                for chunk in chunks:
+                    if chunk.strip():  # Ignore les chunks vides
+                        yield make_document(chunk)
+                        chunk_index += 1
+        except Exception as e:
+            raise Exception(f"Erreur lors de l'extraction PDF : {str(e)}")
+
+        for chunk in self.text_splitter.split_text(buffer.strip()):
+            if chunk.strip():
+                yield make_document(chunk)
+                chunk_index += 1
+
+    def _generate_response(self, question: str, filename: str, entry: Dict) -> str:
         """
         Génère une réponse contextuelle basée sur le document
         """
         try:
-            # Utilise RetrievalQA pour une réponse plus intelligente
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vectorstore.as_retriever(search_kwargs={"k": 4}),
-                return_source_documents=True
-            )
+            # Chaîne de questions-réponses sur les passages retrouvés (même prompt "stuff" que RetrievalQA)
+            qa_chain = load_qa_chain(llm=self.llm, chain_type="stuff")
             
             # Améliore la question pour un meilleur contexte
             enhanced_question = f"""
@@ -161,29 +406,34 @@ class DocumentReaderTool:
             4. Mentionner si certaines informations ne sont pas disponibles dans le document
             """
             
-            result = qa_chain({"query": enhanced_question})
+            # Verrou de l'index limité à la recherche : une ingestion en cours ne modifie pas l'index
+            # pendant la recherche, et l'appel au LLM ne bloque ni l'ingestion ni les autres questions
+            with entry["lock"]:
+                source_documents = entry["vectorstore"].similarity_search(enhanced_question, k=4)
+            result = qa_chain({"input_documents": source_documents, "question": enhanced_question})
             
             response = f"📄 **Analyse du document :** *{filename}*\n\n"
             response += f"**Question posée :** {question}\n\n"
-            response += f"**Réponse :**\n\n{result['result']}\n\n"
+            response += f"**Réponse :**\n\n{result['output_text']}\n\n"
             
             # Ajoute des informations sur les sources si disponibles
-            if 'source_documents' in result and result['source_documents']:
-                response += f"**Sources utilisées :** {len(result['source_documents'])} sections du document\n"
+            if source_documents:
+                response += f"**Sources utilisées :** {len(source_documents)} sections du document\n"
             
             return response
             
         except Exception as e:
-            # Fallback sur la méthode simple si RetrievalQA échoue
-            return self._simple_response(question, filename)
+            # Fallback sur la méthode simple si la chaîne de questions-réponses échoue
+            return self._simple_response(question, filename, entry)
 
-    def _simple_response(self, question: str, filename: str) -> str:
+    def _simple_response(self, question: str, filename: str, entry: Dict) -> str:
         """
         Méthode de fallback pour générer une réponse simple
         """
         try:
             # Recherche de similarité simple
-            relevant_docs = self.vectorstore.similarity_search(question, k=3)
+            with entry["lock"]:
+                relevant_docs = entry["vectorstore"].similarity_search(question, k=3)
             context = "\n\n".join([doc.page_content for doc in relevant_docs])
             
             response = f"📄 **Analyse du document :** *{filename}*\n\n"
@@ -200,9 +450,28 @@ class DocumentReaderTool:
 
     def get_document_info(self) -> str:
         """
-        Retourne des informations sur le document actuellement chargé
+        Retourne des informations sur les documents chargés en mémoire
         """
-        if not self.current_doc:
+        documents = self.registry.list_documents()
+        if not documents:
             return "Aucun document chargé."
-        
-        return f"Document actuel : {os.path.basename(self.current_doc)}"
\ No newline at end of file
+
+        current = os.path.abspath(self.current_doc) if self.current_doc else None
+        info = f"📚 Documents chargés ({len(documents)}) :\n"
+        for doc in reversed(documents):
+            marker = " (actuel)" if doc["path"] == current else ""
+            info += (f"• {os.path.basename(doc['path'])}{marker} : {doc['chunks']} sections, "
+                     f"{doc['size_bytes'] / (1024 * 1024):.1f} Mo\n")
+        return info
+
+    def unload_document(self, path_or_hash: str) -> bool:
+        """
+        Décharge un document de la mémoire (il reste disponible dans le cache disque)
+        """
+        return self.registry.remove(path_or_hash)
+
+    def get_cache_stats(self) -> dict:
+        """
+        Retourne les statistiques du cache d'index (hits, misses, taille)
+        """
+        return self.index_cache.get_stats()
\ No newline at end of file
@@ -0,0 +1,279 @@
+import ast
+import math
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+# Fonctions et constantes autorisées dans les expressions
+SAFE_FUNCTIONS: Dict[str, Callable] = {
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+    'asin': math.asin, 'acos': math.acos, 'atan': math.atan,
+    'log': math.log, 'log10': math.log10, 'ln': math.log,
+    'sqrt': math.sqrt, 'abs': abs, 'ceil': math.ceil,
+    'floor': math.floor, 'round': round, 'exp': math.exp, 'pow': pow
+}
+SAFE_CONSTANTS: Dict[str, float] = {'pi': math.pi, 'e': math.e}
+# Équivalents NumPy pour l'évaluation vectorisée (tableaux de valeurs)
+VECTOR_FUNCTIONS: Dict[str, Callable] = {
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+    'log': np.log, 'log10': np.log10, 'ln': np.log,
+    'sqrt': np.sqrt, 'abs': np.abs, 'ceil': np.ceil,
+    'floor': np.floor, 'round': np.round, 'exp': np.exp, 'pow': np.power
+}
+
+# Liste blanche des nœuds de l'arbre syntaxique : arithmétique, appels de fonctions, noms
+ALLOWED_BINARY_OPS = {ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow}
+ALLOWED_UNARY_OPS = {ast.UAdd, ast.USub}
+# round(x, n) sur un entier calcule 10**|n| : au-delà, aucun sens pour des flottants double précision
+MAX_ROUND_DIGITS = 308
+# Puissance modulaire : coût estimé (bits de l'exposant × bits du modulo²) toléré par bit de la limite max_bits
+MODPOW_COST_PER_BIT = 10_000
+
+
+class ExpressionError(ValueError):
+    """
+    Expression refusée (syntaxe, nœud ou nom non autorisé, variable manquante)
+    """
+
+
+class ExpressionTooExpensive(ExpressionError):
+    """
+    Calcul trop coûteux : taille estimée du résultat (en bits) au-delà de la limite,
+    ou coût équivalent exprimé en bits (reason précise alors la cause)
+    """
+    def __init__(self, bits: float, limit: Optional[float] = None, reason: Optional[str] = None):
+        super().__init__(bits, limit, reason)
+        self.bits = bits
+        self.limit = limit
+        self.reason = reason
+
+    def __str__(self):
+        if self.reason:
+            return f"calcul trop coûteux ({self.reason})"
+        if math.isinf(self.bits):
+            return "calcul trop coûteux (limite de temps ou de mémoire dépassée)"
+        return f"calcul trop coûteux (résultat estimé à {self.bits / math.log2(10):.3g} chiffres)"
+
+
+def guarded_pow(base, exponent, modulo=None, max_bits: float = 1_000_000):
+    """
+    Puissance avec estimation préalable de la taille du résultat entier :
+    9**9**9 ou pow(10, 10**9) sont refusés avant tout calcul.
+    Le résultat d'une puissance modulaire reste petit mais son coût croît avec
+    bits(exposant) × bits(modulo)² : pow(3, 10**6000, 10**6000 + 7) est refusé de même.
+    """
+    if modulo is not None:
+        if isinstance(exponent, int) and isinstance(modulo, int) and exponent > 0:
+            cost = exponent.bit_length() * modulo.bit_length() ** 2
+            if cost > max_bits * MODPOW_COST_PER_BIT:
+                raise ExpressionTooExpensive(cost / MODPOW_COST_PER_BIT, max_bits,
+                                             f"puissance modulaire d'environ {cost:.3g} opérations")
+        return pow(base, exponent, modulo)
+    if (isinstance(base, int) and isinstance(exponent, int)
+            and exponent > 0 and abs(base) > 1):
+        bits = exponent * math.log2(abs(base))
+        if bits > max_bits:
+            raise ExpressionTooExpensive(bits, max_bits)
+    return pow(base, exponent)
+
+
+def guarded_mul(left, right, max_bits: float = 1_000_000):
+    """
+    Produit avec contrôle de la taille du résultat entier : une chaîne de produits de grandes
+    puissances (chacune acceptable) ne peut pas dépasser la limite
+    """
+    if isinstance(left, int) and isinstance(right, int):
+        bits = left.bit_length() + right.bit_length()
+        if bits > max_bits:
+            raise ExpressionTooExpensive(bits, max_bits)
+    return left * right
+
+
+def guarded_round(number, ndigits=None):
+    """
+    round avec un nombre de décimales borné : round(1, -10**7) calculerait 10**(10**7)
+    """
+    if ndigits is None:
+        return round(number)
+    if isinstance(ndigits, int) and abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ExpressionError(f"nombre de décimales hors limites (|{ndigits}| > {MAX_ROUND_DIGITS})")
+    return round(number, ndigits)
+
+
+# Fonctions intégrées remplacées par leur version gardée (nom interne inaccessible depuis l'expression)
+GUARDED_BUILTINS = {"pow": (pow, "_pow"), "round": (round, "_round")}
+
+
+class CompiledExpression:
+    def __init__(self, source: str, code, variables: Tuple[str, ...], functions: Dict[str, Callable],
+                 vector_functions: Dict[str, Callable]):
+        """
+        Expression validée et compilée une fois pour toutes ; seules les variables changent d'un appel à l'autre.
+        Le même bytecode sert à l'évaluation vectorisée : seules les fonctions liées aux noms changent.
+        """
+        self.source = source
+        self.code = code
+        self.variables = variables
+        self._globals = {"__builtins__": {}, **functions}
+        self._vector_globals = {"__builtins__": {}, **vector_functions,
+                                "_pow": np.power, "_mul": np.multiply, "_round": np.round}
+
+    def _locals(self, values: Dict) -> Dict:
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise ExpressionError(f"variable non définie : {', '.join(missing)}")
+        return {name: values[name] for name in self.variables}
+
+    def __call__(self, **values):
+        return eval(self.code, self._globals, self._locals(values))
+
+    def vectorized(self, **arrays) -> np.ndarray:
+        """
+        Évalue l'expression sur des tableaux NumPy en une passe (diffusion des scalaires).
+        Les valeurs hors domaine donnent nan/inf au lieu d'une exception.
+        """
+        values = {name: np.asarray(value, dtype=np.float64) for name, value in arrays.items()}
+        with np.errstate(all="ignore"):
+            result = eval(self.code, self._vector_globals, self._locals(values))
+        return np.asarray(result, dtype=np.float64)
+
+
+class _Validator(ast.NodeTransformer):
+    """
+    Vérifie chaque nœud contre la liste blanche et remplace les constantes nommées par leur valeur
+    (le compilateur Python précalcule ensuite les sous-expressions constantes).
+    """
+    def __init__(self, functions: Dict[str, Callable], constants: Dict[str, float]):
+        self.functions = functions
+        self.constants = constants
+        self.variables = []
+
+    def generic_visit(self, node):
+        raise ExpressionError(f"élément non autorisé : {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"constante non autorisée : {node.value!r}")
+        return node
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in ALLOWED_BINARY_OPS:
+            raise ExpressionError(f"opérateur non autorisé : {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        # a ** b et a * b passent par les versions gardées (noms inaccessibles depuis l'expression)
+        guarded = {ast.Pow: "_pow", ast.Mult: "_mul"}.get(type(node.op))
+        if guarded:
+            return ast.copy_location(ast.Call(ast.Name(guarded, ast.Load()), [node.left, node.right], []), node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if type(node.op) not in ALLOWED_UNARY_OPS:
+            raise ExpressionError(f"opérateur non autorisé : {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in self.functions:
+            raise ExpressionError(f"fonction non autorisée : {ast.unparse(node.func)}")
+        if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+            raise ExpressionError("seuls les arguments positionnels sont autorisés")
+        node.args = [self.visit(arg) for arg in node.args]
+        builtin, guarded = GUARDED_BUILTINS.get(node.func.id, (None, None))
+        if builtin is not None and self.functions[node.func.id] is builtin:
+            node.func = ast.copy_location(ast.Name(guarded, ast.Load()), node.func)
+        return node
+
+    def visit_Name(self, node):
+        if node.id in self.constants:
+            return ast.copy_location(ast.Constant(self.constants[node.id]), node)
+        if node.id in self.functions:
+            raise ExpressionError(f"fonction utilisée sans appel : {node.id}")
+        if node.id.startswith("_"):
+            raise ExpressionError(f"nom non autorisé : {node.id}")
+        # Tout autre nom est une variable, fournie à l'évaluation
+        if node.id not in self.variables:
+            self.variables.append(node.id)
+        return node
+
+
+class ExpressionEngine:
+    def __init__(self, functions: Optional[Dict[str, Callable]] = None,
+                 constants: Optional[Dict[str, float]] = None, cache_size: int = 512,
+                 max_pow_bits: float = 1_000_000):
+        """
+        Moteur d'expressions mathématiques : analyse unique vers un arbre syntaxique validé par liste blanche,
+        compilation en bytecode, cache LRU des expressions compilées par texte normalisé.
+        Les puissances et produits entiers dont le résultat dépasserait max_pow_bits sont refusés avant calcul,
+        de même que round avec plus de MAX_ROUND_DIGITS décimales.
+        """
+        self.functions = dict(SAFE_FUNCTIONS if functions is None else functions)
+        self.max_pow_bits = max_pow_bits
+        # Fonction sans équivalent NumPy connu : appliquée élément par élément
+        self.vector_functions = {
+            name: VECTOR_FUNCTIONS[name] if func is SAFE_FUNCTIONS.get(name)
+            else np.vectorize(func, otypes=[np.float64])
+            for name, func in self.functions.items()
+        }
+        self.constants = dict(SAFE_CONSTANTS if constants is None else constants)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, CompiledExpression]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def normalize(expression: str) -> str:
+        # "^" est la puissance pour une calculatrice (jamais le ou exclusif)
+        return " ".join(expression.replace("^", "**").split())
+
+    def compile(self, expression: str) -> CompiledExpression:
+        """
+        Retourne l'expression compilée, depuis le cache si elle a déjà été vue
+        """
+        key = self.normalize(expression)
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return compiled
+            self.stats["misses"] += 1
+
+        if not key:
+            raise ExpressionError("expression vide")
+        try:
+            tree = ast.parse(key, mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"syntaxe invalide : {e.msg}") from None
+        validator = _Validator(self.functions, self.constants)
+        tree = ast.fix_missing_locations(validator.visit(tree))
+        compiled = CompiledExpression(key, compile(tree, "<expression>", "eval"),
+                                      tuple(validator.variables),
+                                      {**self.functions,
+                                       "_pow": partial(guarded_pow, max_bits=self.max_pow_bits),
+                                       "_mul": partial(guarded_mul, max_bits=self.max_pow_bits),
+                                       "_round": guarded_round},
+                                      self.vector_functions)
+
+        with self._lock:
+            self._cache[key] = compiled
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def evaluate(self, expression: str, **values):
+        return self.compile(expression)(**values)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._cache)
+        return stats
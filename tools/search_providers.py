@@ -0,0 +1,259 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from duckduckgo_search import DDGS
+from utils.rate_limiter import TokenBucket
+
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    """
+    Session HTTP avec connexions persistantes (keep-alive) réutilisées entre les recherches
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _DuckDuckGoHTMLParser(HTMLParser):
+    """
+    Extrait titres, liens et extraits d'une page de résultats au format html.duckduckgo.com
+    """
+    def __init__(self):
+        super().__init__()
+        self.results: List[Dict] = []
+        self._field = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "a" and "result__a" in classes:
+            self.results.append({"title": "", "body": "", "href": attrs.get("href", "#")})
+            self._field = "title"
+        elif "result__snippet" in classes and self.results:
+            self._field = "body"
+
+    def handle_endtag(self, tag):
+        if tag in ("a", "td", "div"):
+            self._field = None
+
+    def handle_data(self, data):
+        if self._field and self.results:
+            self.results[-1][self._field] += data
+
+
+class SearchCancelled(Exception):
+    """
+    Appel abandonné par le moteur (un autre fournisseur a répondu, ou délai dépassé)
+    """
+
+
+class SearchProvider(ABC):
+    name = "provider"
+
+    def __init__(self, timeout: float = 5.0, rate_limiter: Optional[TokenBucket] = None):
+        self.timeout = timeout
+        # Jeton pris par le moteur avant le lancement : l'attente ne compte pas dans le délai
+        self.rate_limiter = rate_limiter
+
+    @abstractmethod
+    def search(self, query: str, max_results: int = 5, cancelled: Optional[threading.Event] = None,
+               deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Retourne des résultats normalisés : {"title", "body", "href"}.
+        cancelled est levé quand le moteur abandonne l'appel ; deadline (horloge time.monotonic)
+        borne le délai de chaque requête HTTP.
+        """
+
+    def _request_timeout(self, cancelled: Optional[threading.Event], deadline: Optional[float]) -> float:
+        """
+        Délai de la prochaine requête HTTP : jamais au-delà de l'échéance fixée par le moteur
+        """
+        if cancelled is not None and cancelled.is_set():
+            raise SearchCancelled(self.name)
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"délai de {self.timeout} s dépassé")
+        return min(self.timeout, remaining)
+
+
+class DuckDuckGoProvider(SearchProvider):
+    name = "duckduckgo"
+
+    def __init__(self, timeout: float = 5.0, endpoint: Optional[str] = None,
+                 session: Optional[requests.Session] = None, rate_limiter: Optional[TokenBucket] = None):
+        """
+        DuckDuckGo via la bibliothèque DDGS, ou via un endpoint au format html.duckduckgo.com
+        (serveur de substitution en test) avec une session HTTP partagée.
+        """
+        super().__init__(timeout, rate_limiter)
+        self.endpoint = endpoint
+        self.session = session or make_session()
+        # DDGS n'est pas thread-safe : un client par thread du pool de recherche
+        self._local = threading.local()
+
+    def _client(self) -> DDGS:
+        client = getattr(self._local, "ddgs", None)
+        if client is None:
+            client = self._local.ddgs = DDGS(timeout=max(1, int(self.timeout)))
+        return client
+
+    def search(self, query: str, max_results: int = 5, cancelled: Optional[threading.Event] = None,
+               deadline: Optional[float] = None) -> List[Dict]:
+        timeout = self._request_timeout(cancelled, deadline)
+        if not self.endpoint:
+            client = self._client()
+            # DDGS applique client.timeout à chacune de ses requêtes : le temps restant avant l'échéance
+            client.timeout = timeout
+            results = list(client.text(query, max_results=max_results))
+        else:
+            response = self.session.post(self.endpoint, data={"q": query}, timeout=timeout)
+            response.raise_for_status()
+            parser = _DuckDuckGoHTMLParser()
+            parser.feed(response.text)
+            results = [
+                {key: value.strip() for key, value in result.items()}
+                for result in parser.results[:max_results]
+            ]
+        if cancelled is not None and cancelled.is_set():
+            raise SearchCancelled(self.name)
+        return results
+
+
+class SerperProvider(SearchProvider):
+    name = "serper"
+
+    def __init__(self, api_key: str, timeout: float = 5.0, endpoint: str = "https://google.serper.dev/search",
+                 session: Optional[requests.Session] = None):
+        """
+        Recherche Google via Serper (https://serper.dev)
+        """
+        super().__init__(timeout)
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.session = session or make_session()
+
+    def search(self, query: str, max_results: int = 5, cancelled: Optional[threading.Event] = None,
+               deadline: Optional[float] = None) -> List[Dict]:
+        headers = {
+            "X-API-KEY": self.api_key,
+            "Content-Type": "application/json"
+        }
+        response = self.session.post(self.endpoint, json={"q": query}, headers=headers,
+                                     timeout=self._request_timeout(cancelled, deadline))
+        response.raise_for_status()
+        return [
+            {
+                "title": res.get("title", "Sans titre"),
+                "body": res.get("snippet", "Pas de description."),
+                "href": res.get("link", "#")
+            }
+            for res in response.json().get("organic", [])[:max_results]
+        ]
+
+
+class HedgedSearchEngine:
+    def __init__(self, providers: List[SearchProvider], hedge_after: Optional[float] = 1.0,
+                 max_workers: int = 8):
+        """
+        Interroge les fournisseurs dans l'ordre. Si le premier n'a pas répondu après hedge_after secondes
+        (ou a échoué), le suivant est lancé en parallèle ; le premier résultat non vide l'emporte
+        et les autres sont abandonnés. Chaque fournisseur a son propre délai (timeout), décompté après
+        l'obtention de son jeton de débit ; l'échéance et un signal d'abandon sont transmis au fournisseur,
+        qui borne ses requêtes HTTP en conséquence : un appel abandonné ne retient pas un thread du pool.
+        Avec hedge_after=None, le suivant n'est lancé qu'après l'échec du précédent.
+        """
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="web-search")
+        self._lock = threading.Lock()
+        self.stats = {"hedged": 0, "errors": 0, "timeouts": 0, "abandoned": 0}
+        self.stats.update({f"wins_{provider.name}": 0 for provider in providers})
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def search(self, query: str, max_results: int = 5) -> Tuple[str, List[Dict]]:
+        """
+        Retourne (nom du fournisseur, résultats) ; lève une exception si tous échouent
+        """
+        pending = {}
+        deadlines = {}
+        cancel_events = {}
+        errors = []
+        remaining = list(self.providers)
+
+        def launch():
+            provider = remaining.pop(0)
+            if provider.rate_limiter is not None:
+                provider.rate_limiter.acquire()
+            deadline = time.monotonic() + provider.timeout
+            cancelled = threading.Event()
+            future = self._executor.submit(provider.search, query, max_results, cancelled, deadline)
+            pending[future] = provider
+            deadlines[future] = deadline
+            cancel_events[future] = cancelled
+
+        def abandon(future):
+            cancel_events.pop(future).set()
+            future.cancel()
+
+        launch()
+        next_hedge = time.monotonic() + self.hedge_after if self.hedge_after is not None else None
+
+        while pending:
+            now = time.monotonic()
+            wake_up = min(deadlines.values())
+            if remaining and next_hedge is not None:
+                wake_up = min(wake_up, next_hedge)
+            done, _ = wait(list(pending), timeout=max(0.0, wake_up - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                deadlines.pop(future)
+                cancel_events.pop(future)
+                try:
+                    results = future.result()
+                    if not results:
+                        raise Exception(f"Aucun résultat {provider.name}.")
+                except Exception as e:
+                    self._count("errors")
+                    errors.append(f"{provider.name} : {e}")
+                    continue
+                # Premier résultat valable : les autres appels sont abandonnés
+                for other in pending:
+                    abandon(other)
+                self._count("abandoned", len(pending))
+                self._count(f"wins_{provider.name}")
+                return provider.name, results
+
+            now = time.monotonic()
+            for future in [f for f, deadline in deadlines.items() if deadline <= now]:
+                provider = pending.pop(future)
+                deadlines.pop(future)
+                abandon(future)
+                self._count("timeouts")
+                errors.append(f"{provider.name} : délai de {provider.timeout} s dépassé")
+
+            # Fournisseur suivant : après échec du précédent, ou en couverture si la réponse tarde
+            if remaining and (not pending or (next_hedge is not None and now >= next_hedge)):
+                if pending:
+                    self._count("hedged")
+                launch()
+                next_hedge = now + self.hedge_after if self.hedge_after is not None else None
+
+        raise Exception(" ; ".join(errors) or "Aucun fournisseur de recherche disponible.")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
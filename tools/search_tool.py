@@ -1,73 +1,147 @@
+import json
 import os
+import re
+import threading
 import time
-import requests
+import unicodedata
+from collections import OrderedDict
 from dotenv import load_dotenv
-from typing import Any
-from duckduckgo_search import DDGS
+from typing import Any, Dict, Optional
+from tools.search_providers import DuckDuckGoProvider, HedgedSearchEngine, SerperProvider, make_session
+from utils.rate_limiter import TokenBucket
 
 load_dotenv()
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
 class WebSearchTool:
-    def __init__(self):
-        self.ddgs = DDGS()
+    def __init__(self, cache_ttl: float = 3600, cache_max_entries: int = 256,
+                 cache_file: Optional[str] = None, requests_per_second: float = 0.67, burst: int = 3,
+                 timeout: float = 5.0, hedge_after: Optional[float] = 1.0,
+                 ddg_endpoint: Optional[str] = None, serper_endpoint: str = "https://google.serper.dev/search"):
+        # Cache des résultats par requête normalisée (TTL + LRU), éventuellement persisté
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.cache_file = cache_file
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._load_cache()
+        # Budget de requêtes DuckDuckGo : attente uniquement si le débit réel le dépasse
+        self.rate_limiter = TokenBucket(requests_per_second, capacity=burst)
+        self.stats = {"hits": 0, "misses": 0}
+
+        # Connexions persistantes partagées, délai par fournisseur, couverture par Serper si DuckDuckGo tarde
+        self.session = make_session()
+        providers = [DuckDuckGoProvider(timeout=timeout, endpoint=ddg_endpoint, session=self.session,
+                                        rate_limiter=self.rate_limiter)]
+        if SERPER_API_KEY:
+            providers.append(SerperProvider(SERPER_API_KEY, timeout=timeout, endpoint=serper_endpoint,
+                                            session=self.session))
+        self.engine = HedgedSearchEngine(providers, hedge_after=hedge_after)
 
     def search(self, query: str) -> str:
         """
-        Tente une recherche avec DuckDuckGo. Si échec, fallback sur Serper API (Google).
+        Recherche DuckDuckGo, doublée par Serper (Google) si la réponse tarde ou échoue.
+        Une requête déjà faite récemment est servie depuis le cache, sans appel ni attente.
         """
+        key = self._normalize(query)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
         try:
-            time.sleep(1.5)  # pour limiter les requêtes trop fréquentes
-            results = list(self.ddgs.text(query, max_results=5))
-            if not results:
-                raise Exception("Aucun résultat DuckDuckGo.")
-            return self._format_duckduckgo_results(query, results)
-        
+            provider, results = self.engine.search(query, max_results=5)
         except Exception as e:
-            fallback_result = self._fallback_serper(query)
-            return fallback_result or f"Erreur lors des recherches web : {e}"
+            return f"Erreur lors des recherches web : {e}"
 
-    def _format_duckduckgo_results(self, query: str, results: list[dict]) -> str:
-        output = f"🔍 Résultats DuckDuckGo pour '{query}' :\n\n"
-        for i, res in enumerate(results, 1):
-            title = res.get("title", "Sans titre")
-            snippet = res.get("body", "Pas de description.")
-            link = res.get("href", "#")
-            output += f"{i}. **{title}**\n   {snippet}\n   🔗 {link}\n\n"
+        if provider == SerperProvider.name:
+            output = self._format_serper_results(query, results)
+        else:
+            output = self._format_duckduckgo_results(query, results)
+        self._cache_put(key, output)
         return output
 
-    def _fallback_serper(self, query: str) -> str:
+    def search_results(self, query: str, max_results: int = 5) -> list[dict]:
+        """
+        Résultats bruts {"title", "body", "href"} (sans cache), pour la lecture des pages
+        """
+        _, results = self.engine.search(query, max_results=max_results)
+        return results
+
+    @staticmethod
+    def _normalize(query: str) -> str:
         """
-        Recherche via Serper (https://serper.dev) si DuckDuckGo échoue.
+        Clé de cache : minuscules, espaces normalisés, ponctuation finale ignorée
         """
-        if not SERPER_API_KEY:
-            return "❌ Serper API Key non trouvée dans l'environnement."
+        query = unicodedata.normalize("NFKC", query).lower()
+        query = re.sub(r"\s+", " ", query).strip()
+        return query.rstrip(" ?!.")
 
-        url = "https://google.serper.dev/search"
-        headers = {
-            "X-API-KEY": SERPER_API_KEY,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "q": query
-        }
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.time() - entry["time"] <= self.cache_ttl:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["output"]
+            if entry is not None:
+                del self._cache[key]
+            self.stats["misses"] += 1
+            return None
 
+    def _cache_put(self, key: str, output: str):
+        with self._cache_lock:
+            self._cache[key] = {"time": time.time(), "output": output}
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+            self._save_cache()
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get("organic", [])
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            now = time.time()
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]["time"]):
+                if now - entry["time"] <= self.cache_ttl:
+                    self._cache[key] = entry
+        except Exception as e:
+            print(f"Cache de recherche web illisible, ignoré : {e}")
+
+    def _save_cache(self):
+        """
+        Écrit le cache sur disque (remplacement atomique), si la persistance est activée
+        """
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
 
-            if not results:
-                return "Aucun résultat trouvé via Serper."
+    def get_stats(self) -> Dict:
+        """
+        Statistiques du cache, du limiteur de débit et des fournisseurs
+        """
+        with self._cache_lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._cache)
+        stats["rate_limit_wait_s"] = round(self.rate_limiter.total_wait, 2)
+        stats.update(self.engine.get_stats())
+        return stats
 
-            output = f"🔍 Résultats Serper (Google) pour '{query}' :\n\n"
-            for i, res in enumerate(results[:5], 1):
-                title = res.get("title", "Sans titre")
-                snippet = res.get("snippet", "Pas de description.")
-                link = res.get("link", "#")
-                output += f"{i}. **{title}**\n   {snippet}\n   🔗 {link}\n\n"
-            return output
+    def _format_duckduckgo_results(self, query: str, results: list[dict]) -> str:
+        output = f"🔍 Résultats DuckDuckGo pour '{query}' :\n\n"
+        for i, res in enumerate(results, 1):
+            title = res.get("title", "Sans titre")
+            snippet = res.get("body", "Pas de description.")
+            link = res.get("href", "#")
+            output += f"{i}. **{title}**\n   {snippet}\n   🔗 {link}\n\n"
+        return output
 
-        except Exception as e:
-            return f"❌ Erreur Serper API : {str(e)}"
+    def _format_serper_results(self, query: str, results: list[dict]) -> str:
+        output = f"🔍 Résultats Serper (Google) pour '{query}' :\n\n"
+        for i, res in enumerate(results, 1):
+            output += f"{i}. **{res['title']}**\n   {res['body']}\n   🔗 {res['href']}\n\n"
+        return output
@@ -0,0 +1,359 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class TodoStore:
+    def __init__(self, db_path: str = "todo_list.sqlite3"):
+        """
+        Stockage SQLite (WAL) des tâches, partagé par les sessions (colonne scope)
+        et sûr entre plusieurs processus (workers uvicorn) : chaque modification est une transaction.
+        Les ID sont croissants par scope et jamais réutilisés après une suppression.
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par thread ; transactions explicites (isolation_level=None)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transaction d'écriture : verrou pris dès le début (BEGIN IMMEDIATE),
+        les autres processus attendent au lieu d'écraser la modification
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._transaction() as conn:
+            # Schéma 1 : identifiant interne stable (uid), requis par l'index plein texte
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todos'"
+            ).fetchone() and not any(
+                column["name"] == "uid" for column in conn.execute("PRAGMA table_info(todos)")
+            )
+            if legacy:
+                conn.execute("ALTER TABLE todos RENAME TO todos_v0")
+                conn.execute("DROP INDEX IF EXISTS todos_scope_completed")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS todos (
+                    uid INTEGER PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    task TEXT NOT NULL,
+                    created TEXT NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    completed_date TEXT,
+                    UNIQUE (scope, id)
+                )
+            """)
+            if legacy:
+                conn.execute("""
+                    INSERT INTO todos (scope, id, task, created, completed, completed_date)
+                    SELECT scope, id, task, created, completed, completed_date FROM todos_v0 ORDER BY scope, id
+                """)
+                conn.execute("DROP TABLE todos_v0")
+            # Filtres par statut et par date de création sans parcours complet
+            conn.execute("CREATE INDEX IF NOT EXISTS todos_scope_completed ON todos (scope, completed, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS todos_scope_created ON todos (scope, created)")
+
+            # Recherche plein texte (FTS5, insensible aux accents) sur le libellé des tâches
+            fts_missing = not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todos_fts'"
+            ).fetchone()
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+                    task, content = 'todos', content_rowid = 'uid',
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+                    INSERT INTO todos_fts (rowid, task) VALUES (new.uid, new.task);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+                    INSERT INTO todos_fts (todos_fts, rowid, task) VALUES ('delete', old.uid, old.task);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF task ON todos BEGIN
+                    INSERT INTO todos_fts (todos_fts, rowid, task) VALUES ('delete', old.uid, old.task);
+                    INSERT INTO todos_fts (rowid, task) VALUES (new.uid, new.task);
+                END
+            """)
+            if fts_missing:
+                conn.execute("INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')")
+
+            # Prochain ID par scope : monotone même après suppression de la dernière tâche
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS todo_scopes (
+                    scope TEXT PRIMARY KEY,
+                    next_id INTEGER NOT NULL
+                )
+            """)
+            # Version des tâches par scope, incrémentée à chaque modification (jamais remise à zéro) :
+            # les caches de chaque processus la comparent pour détecter les modifications des autres
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS todo_versions (
+                    scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            # Fichiers JSON déjà importés (migration unique)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS todo_migrations (
+                    source TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    imported INTEGER NOT NULL,
+                    migrated_at TEXT NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        todo = dict(row)
+        todo.pop("uid", None)
+        todo.pop("scope", None)
+        todo["completed"] = bool(todo["completed"])
+        if todo.get("completed_date") is None:
+            todo.pop("completed_date", None)
+        return todo
+
+    @staticmethod
+    def _next_id(conn: sqlite3.Connection, scope: str, count: int = 1) -> int:
+        """
+        Réserve count ID consécutifs pour le scope (dans la transaction en cours) et retourne le premier
+        """
+        row = conn.execute("SELECT next_id FROM todo_scopes WHERE scope = ?", (scope,)).fetchone()
+        first = row["next_id"] if row else 1
+        conn.execute(
+            "INSERT INTO todo_scopes (scope, next_id) VALUES (?, ?) "
+            "ON CONFLICT(scope) DO UPDATE SET next_id = excluded.next_id",
+            (scope, first + count)
+        )
+        return first
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, scope: str):
+        conn.execute(
+            "INSERT INTO todo_versions (scope, version) VALUES (?, 1) "
+            "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+            (scope,)
+        )
+
+    def version(self, scope: str) -> int:
+        """
+        Version courante des tâches du scope (0 si jamais modifiées)
+        """
+        row = self._connection().execute(
+            "SELECT version FROM todo_versions WHERE scope = ?", (scope,)
+        ).fetchone()
+        return row["version"] if row else 0
+
+    def add(self, scope: str, task: str) -> Dict:
+        created = datetime.now().isoformat()
+        with self._transaction() as conn:
+            task_id = self._next_id(conn, scope)
+            conn.execute(
+                "INSERT INTO todos (scope, id, task, created, completed) VALUES (?, ?, ?, ?, 0)",
+                (scope, task_id, task, created)
+            )
+            self._bump_version(conn, scope)
+        return {"id": task_id, "task": task, "created": created, "completed": False}
+
+    def get(self, scope: str, task_id: int) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT * FROM todos WHERE scope = ? AND id = ?", (scope, task_id)
+        ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, scope: str) -> List[Dict]:
+        rows = self._connection().execute(
+            "SELECT * FROM todos WHERE scope = ? ORDER BY id", (scope,)
+        ).fetchall()
+        return [self._row(row) for row in rows]
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        # Chaque mot est cité (aucune syntaxe FTS5 interprétée) et recherché comme préfixe
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+    def _filters(self, scope: str, status: Optional[str] = None, text: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None) -> Tuple[str, List]:
+        """
+        Clause WHERE et paramètres ; status : "open", "done" ou None (toutes),
+        since/until : bornes ISO inclusives sur la date de création
+        """
+        where = ["scope = ?"]
+        params: List = [scope]
+        if status in ("open", "done"):
+            where.append("completed = ?")
+            params.append(int(status == "done"))
+        if text and text.split():
+            where.append("uid IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?)")
+            params.append(self._fts_query(text))
+        if since:
+            where.append("created >= ?")
+            params.append(since)
+        if until:
+            # Date seule : toute la journée est incluse
+            where.append("created < ?")
+            params.append(until + "\uffff" if len(until) == 10 else until)
+        return " AND ".join(where), params
+
+    def query(self, scope: str, status: Optional[str] = None, text: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None, limit: int = 20,
+              offset: int = 0, newest_first: bool = True) -> Tuple[List[Dict], int]:
+        """
+        Page de tâches filtrées (plus récentes d'abord par défaut) et nombre total de correspondances
+        """
+        where, params = self._filters(scope, status, text, since, until)
+        conn = self._connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM todos WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM todos WHERE {where} ORDER BY id {'DESC' if newest_first else 'ASC'} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [self._row(row) for row in rows], total
+
+    def count_by_status(self, scope: str, text: Optional[str] = None, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, int]:
+        where, params = self._filters(scope, None, text, since, until)
+        counts = {"open": 0, "done": 0}
+        for completed, count in self._connection().execute(
+            f"SELECT completed, COUNT(*) FROM todos WHERE {where} GROUP BY completed", params
+        ):
+            counts["done" if completed else "open"] = count
+        return counts
+
+    def count(self, scope: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM todos WHERE scope = ?", (scope,)
+        ).fetchone()[0]
+
+    def mark_done(self, scope: str, task_id: int) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "UPDATE todos SET completed = 1, completed_date = ? WHERE scope = ? AND id = ? RETURNING *",
+                (datetime.now().isoformat(), scope, task_id)
+            ).fetchone()
+            if row:
+                self._bump_version(conn, scope)
+        return self._row(row) if row else None
+
+    def remove(self, scope: str, task_id: int) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "DELETE FROM todos WHERE scope = ? AND id = ? RETURNING *", (scope, task_id)
+            ).fetchone()
+            if row:
+                self._bump_version(conn, scope)
+        return self._row(row) if row else None
+
+    def clear(self, scope: str):
+        """
+        Supprime toutes les tâches du scope (les ID repartent de 1)
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM todos WHERE scope = ?", (scope,))
+            conn.execute("DELETE FROM todo_scopes WHERE scope = ?", (scope,))
+            self._bump_version(conn, scope)
+
+    def migrate_json(self, scope: str, json_file: str) -> int:
+        """
+        Importe une seule fois un ancien fichier JSON dans le scope, puis le renomme en .migrated.
+        Les ID en double (anciennes collisions après suppression) reçoivent un nouvel ID.
+        Retourne le nombre de tâches importées.
+        """
+        if not os.path.exists(json_file):
+            return 0
+        source = os.path.abspath(json_file)
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                todos = json.load(f)
+        except Exception as e:
+            print(f"Liste de tâches JSON illisible, non migrée : {e}")
+            return 0
+
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM todo_migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+            used = {row["id"] for row in conn.execute("SELECT id FROM todos WHERE scope = ?", (scope,))}
+            rows = []
+            duplicates = []
+            for todo in todos:
+                task_id = todo.get("id")
+                if isinstance(task_id, int) and task_id > 0 and task_id not in used:
+                    used.add(task_id)
+                    rows.append((task_id, todo))
+                else:
+                    duplicates.append(todo)
+
+            next_id = max(max(used, default=0) + 1, self._next_id(conn, scope, 0))
+            for offset, todo in enumerate(duplicates):
+                rows.append((next_id + offset, todo))
+            conn.execute("UPDATE todo_scopes SET next_id = ? WHERE scope = ?",
+                         (next_id + len(duplicates), scope))
+
+            conn.executemany(
+                "INSERT INTO todos (scope, id, task, created, completed, completed_date) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (scope, task_id, str(todo.get("task", "")), todo.get("created") or datetime.now().isoformat(),
+                     int(bool(todo.get("completed"))), todo.get("completed_date"))
+                    for task_id, todo in rows
+                ]
+            )
+            conn.execute(
+                "INSERT INTO todo_migrations (source, scope, imported, migrated_at) VALUES (?, ?, ?, ?)",
+                (source, scope, len(rows), datetime.now().isoformat())
+            )
+            if rows:
+                self._bump_version(conn, scope)
+
+        try:
+            os.replace(json_file, json_file + ".migrated")
+        except OSError:
+            pass
+        print(f"📦 {len(rows)} tâche(s) migrée(s) depuis {json_file}")
+        return len(rows)
+
+
+_shared_stores: Dict[str, TodoStore] = {}
+_shared_lock = threading.Lock()
+
+
+def get_todo_store(db_path: Optional[str] = None) -> TodoStore:
+    """
+    Retourne le stockage partagé par toutes les listes de tâches du processus pour ce fichier
+    """
+    db_path = os.path.abspath(db_path or os.getenv("TODO_DB_PATH", "todo_list.sqlite3"))
+    with _shared_lock:
+        store = _shared_stores.get(db_path)
+        if store is None:
+            store = _shared_stores[db_path] = TodoStore(db_path)
+        return store
@@ -1,29 +1,70 @@
-import json
+import math
 import os
+import re
+import shlex
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, Optional
+
+from tools.todo_store import TodoStore, get_todo_store
+
+# Valeurs acceptées pour le filtre status=
+STATUS_ALIASES = {
+    "open": "open", "todo": "open", "active": "open",
+    "done": "done", "completed": "done",
+    "all": None
+}
 
 class TodoTool:
-    def __init__(self, storage_file: str = "todo_list.json"):
+    def __init__(self, storage_file: str = "todo_list.json", scope: str = "default",
+                 store: Optional[TodoStore] = None, page_size: int = 20, max_page_size: int = 50):
+        """
+        Liste de tâches d'un scope (session) dans le stockage SQLite partagé.
+        storage_file : ancienne liste JSON, importée une seule fois si elle existe.
+        Les listes sont paginées (page_size par défaut, max_page_size au plus) pour borner la sortie de l'outil.
+        """
         self.storage_file = storage_file
-        self.todos = self._load_todos()
+        self.scope = scope
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.store = store or get_todo_store()
+        self.store.migrate_json(scope, storage_file)
+
+    @property
+    def version(self) -> int:
+        """
+        Version des tâches, lue dans le stockage : change à chaque modification, quel que soit le processus
+        """
+        return self.store.version(self.scope)
+
+    @staticmethod
+    def session_file(session_id: str, directory: str = "todo_sessions") -> str:
+        """
+        Ancien fichier de tâches JSON propre à une session (source de migration)
+        """
+        return os.path.join(directory, re.sub(r"[^\w.-]", "_", session_id) + ".json")
     
     def manage_todo(self, command: str) -> str:
         """
         Gère la liste de tâches
         Commandes:
         - add:Tâche à ajouter
-        - list (affiche toutes les tâches)
+        - list (tâches les plus récentes, paginées)
+        - list:status=open text="rapport" since=2025-01-01 until=2025-01-31 limit=10 page=2 order=oldest
+        - count (nombre de tâches, mêmes filtres que list)
         - done:ID (marque comme terminé)
         - remove:ID (supprime)
         """
         try:
+            command = command.strip()
             if command.startswith("add:"):
                 task = command[4:].strip()
                 return self._add_task(task)
             
-            elif command == "list":
-                return self._list_tasks()
+            elif re.match(r"^list\b", command):
+                return self._list_tasks(self._parse_filters(command[4:]))
+            
+            elif re.match(r"^count\b", command):
+                return self._count_tasks(self._parse_filters(command[5:]))
             
             elif command.startswith("done:"):
                 task_id = int(command[5:].strip())
@@ -36,7 +77,9 @@ class TodoTool:
             else:
                 return ("Commandes disponibles:\n"
                        "- add:Votre tâche\n"
-                       "- list\n" 
+                       "- list (filtres optionnels : list:status=open|done|all text=mot since=AAAA-MM-JJ "
+                       "until=AAAA-MM-JJ limit=N page=N order=recent|oldest)\n"
+                       "- count (mêmes filtres)\n"
                        "- done:ID\n"
                        "- remove:ID")
         
@@ -44,24 +87,73 @@ class TodoTool:
             return f"Erreur dans la gestion des tâches : {str(e)}"
     
     def _add_task(self, task: str) -> str:
-        new_task = {
-            "id": len(self.todos) + 1,
-            "task": task,
-            "created": datetime.now().isoformat(),
-            "completed": False
-        }
-        self.todos.append(new_task)
-        self._save_todos()
+        new_task = self.store.add(self.scope, task)
         return f"✅ Tâche ajoutée : '{task}' (ID: {new_task['id']})"
     
-    def _list_tasks(self) -> str:
-        if not self.todos:
+    def _parse_filters(self, text: str) -> Dict:
+        """
+        "status=open text=rapport limit=10" -> filtres ; un mot sans "=" complète la recherche texte
+        """
+        filters = {"status": None, "text": [], "since": None, "until": None,
+                   "limit": self.page_size, "page": 1, "newest_first": True}
+        for token in shlex.split(text.lstrip(" :")):
+            key, sep, value = token.partition("=")
+            key = key.lower()
+            if not sep:
+                filters["text"].append(token)
+            elif key == "status":
+                if value.lower() not in STATUS_ALIASES:
+                    raise ValueError(f"statut inconnu : {value} (open, done ou all)")
+                filters["status"] = STATUS_ALIASES[value.lower()]
+            elif key == "text":
+                filters["text"].append(value)
+            elif key in ("since", "until"):
+                datetime.strptime(value, "%Y-%m-%d")
+                filters[key] = value
+            elif key in ("limit", "page"):
+                filters[key] = max(1, int(value))
+            elif key == "order":
+                filters["newest_first"] = value.lower() != "oldest"
+            else:
+                raise ValueError(f"filtre inconnu : {key}")
+        filters["text"] = " ".join(filters["text"]) or None
+        filters["limit"] = min(filters["limit"], self.max_page_size)
+        return filters
+
+    @staticmethod
+    def _describe_filters(filters: Dict) -> str:
+        parts = []
+        if filters["status"]:
+            parts.append(f"status={filters['status']}")
+        if filters["text"]:
+            parts.append(f"text={shlex.quote(filters['text'])}")
+        for key in ("since", "until"):
+            if filters[key]:
+                parts.append(f"{key}={filters[key]}")
+        if not filters["newest_first"]:
+            parts.append("order=oldest")
+        return " ".join(parts)
+
+    def _list_tasks(self, filters: Optional[Dict] = None) -> str:
+        filters = filters or self._parse_filters("")
+        limit, page = filters["limit"], filters["page"]
+        todos, total = self.store.query(
+            self.scope, status=filters["status"], text=filters["text"],
+            since=filters["since"], until=filters["until"],
+            limit=limit, offset=(page - 1) * limit, newest_first=filters["newest_first"]
+        )
+        if not total:
+            if any(filters[key] for key in ("status", "text", "since", "until")):
+                return "📝 Aucune tâche ne correspond à ces filtres."
             return "📝 Aucune tâche dans votre liste."
+        pages = math.ceil(total / limit)
+        if not todos:
+            return f"📝 Page {page} vide : {total} tâche(s) sur {pages} page(s)."
         
-        active_tasks = [t for t in self.todos if not t['completed']]
-        completed_tasks = [t for t in self.todos if t['completed']]
+        active_tasks = [t for t in todos if not t['completed']]
+        completed_tasks = [t for t in todos if t['completed']]
         
-        result = "📝 **Vos tâches:**\n\n"
+        result = f"📝 **Vos tâches** ({len(todos)} sur {total}, page {page}/{pages}) :\n\n"
         
         if active_tasks:
             result += "**À faire:**\n"
@@ -72,35 +164,38 @@ class TodoTool:
             result += "\n**Terminées:**\n"
             for task in completed_tasks:
                 result += f"• ✓ [{task['id']}] {task['task']}\n"
+
+        if page < pages:
+            described = self._describe_filters(filters)
+            result += f"\n➡️ Suite : list:{described + ' ' if described else ''}limit={limit} page={page + 1}"
         
         return result
+
+    def _count_tasks(self, filters: Dict) -> str:
+        counts = self.store.count_by_status(
+            self.scope, text=filters["text"], since=filters["since"], until=filters["until"]
+        )
+        if filters["status"]:
+            return f"📊 {counts[filters['status']]} tâche(s) {'à faire' if filters['status'] == 'open' else 'terminée(s)'}"
+        return (f"📊 {counts['open'] + counts['done']} tâche(s) : "
+                f"{counts['open']} à faire, {counts['done']} terminée(s)")
     
     def _mark_done(self, task_id: int) -> str:
-        task = next((t for t in self.todos if t['id'] == task_id), None)
+        task = self.store.mark_done(self.scope, task_id)
         if task:
-            task['completed'] = True
-            task['completed_date'] = datetime.now().isoformat()
-            self._save_todos()
             return f"✅ Tâche {task_id} marquée comme terminée : '{task['task']}'"
         return f"❌ Tâche {task_id} non trouvée"
     
     def _remove_task(self, task_id: int) -> str:
-        task = next((t for t in self.todos if t['id'] == task_id), None)
+        task = self.store.remove(self.scope, task_id)
         if task:
-            self.todos.remove(task)
-            self._save_todos()
             return f"🗑️ Tâche supprimée : '{task['task']}'"
         return f"❌ Tâche {task_id} non trouvée"
     
-    def _load_todos(self) -> List[Dict]:
+    def delete_storage(self):
+        """
+        Supprime la liste (et l'ancien fichier JSON s'il existe encore)
+        """
+        self.store.clear(self.scope)
         if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-    
-    def _save_todos(self):
-        with open(self.storage_file, 'w', encoding='utf-8') as f:
-            json.dump(self.todos, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+            os.remove(self.storage_file)
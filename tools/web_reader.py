@@ -0,0 +1,257 @@
+import asyncio
+import re
+import threading
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set
+from urllib.parse import urldefrag, urlparse
+
+import aiohttp
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import FAISS
+from langchain.schema import Document
+from retriever.embedding_cache import get_shared_embeddings
+
+# Balises dont le texte n'appartient pas au contenu principal d'une page
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form"}
+MAIN_TAGS = {"main", "article"}
+BLOCK_TAGS = {"p", "div", "section", "li", "br", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote"}
+
+
+class _MainTextExtractor(HTMLParser):
+    """
+    Texte lisible d'une page HTML : navigation, scripts et pieds de page ignorés,
+    contenu de <main>/<article> privilégié lorsqu'il existe.
+    """
+    def __init__(self):
+        super().__init__()
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._all: List[str] = []
+        self._main: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in MAIN_TAGS:
+            self._main_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in BLOCK_TAGS:
+            self._add("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in MAIN_TAGS and self._main_depth:
+            self._main_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        if tag in BLOCK_TAGS:
+            self._add("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._add(data)
+
+    def _add(self, text: str):
+        self._all.append(text)
+        if self._main_depth:
+            self._main.append(text)
+
+    def text(self) -> str:
+        main = "".join(self._main)
+        text = main if len(main.strip()) >= 200 else "".join(self._all)
+        lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def extract_main_text(html: str) -> Dict[str, str]:
+    parser = _MainTextExtractor()
+    parser.feed(html)
+    parser.close()
+    return {"title": parser.title.strip(), "text": parser.text()}
+
+
+def _shingles(text: str, size: int = 5) -> Set[int]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def _run_sync(coroutine):
+    """
+    Exécute une coroutine depuis du code synchrone. Appelé depuis une boucle asyncio en cours
+    (outil invoqué par un agent asynchrone), asyncio.run échouerait : la coroutine tourne alors
+    dans sa propre boucle, sur un thread auxiliaire.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="web-reader") as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+class WebPageReader:
+    def __init__(self, timeout: float = 8.0, max_bytes: int = 1_000_000, max_connections: int = 10,
+                 per_host: int = 2, duplicate_threshold: float = 0.9, chunk_size: int = 1000,
+                 chunk_overlap: int = 150, user_agent: str = "Mozilla/5.0 (compatible; PersonalAIAgent)"):
+        """
+        Télécharge des pages web en parallèle (asyncio), avec un nombre de connexions borné
+        au total et par hôte, un délai et une taille maximale par page.
+        Le texte principal est extrait, les pages quasi identiques écartées (similarité de Jaccard
+        sur des 5-grammes de mots >= duplicate_threshold), puis découpé et indexé dans un
+        index FAISS éphémère, libéré après chaque lecture.
+        """
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.duplicate_threshold = duplicate_threshold
+        self.user_agent = user_agent
+        # Passages éphémères : embeddings calculés via le regroupeur de requêtes partagé, sans passer par
+        # le cache SQLite persistant (qui grossirait indéfiniment de pages jamais relues)
+        shared = get_shared_embeddings()
+        self.embeddings = getattr(shared, "underlying", shared)
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {"fetched": 0, "failed": 0, "truncated": 0, "duplicates": 0, "chunks": 0}
+
+    def _count(self, key: str, n: int = 1):
+        # Lecteur partagé entre sessions : chaque lecture tourne dans sa propre boucle, sur son thread
+        with self._stats_lock:
+            self.stats[key] += n
+
+    async def _download(self, session: aiohttp.ClientSession, url: str) -> Dict:
+        async with session.get(url, allow_redirects=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "text/html").lower()
+            if "html" not in content_type and not content_type.startswith("text/"):
+                raise ValueError(f"contenu non textuel ({content_type})")
+
+            # Lecture par blocs, interrompue à max_bytes
+            body = bytearray()
+            truncated = False
+            async for block in response.content.iter_chunked(64 * 1024):
+                body.extend(block)
+                if len(body) >= self.max_bytes:
+                    del body[self.max_bytes:]
+                    truncated = True
+                    break
+            text = body.decode(response.charset or "utf-8", errors="replace")
+            page = extract_main_text(text) if "html" in content_type else {"title": "", "text": text}
+            page.update({"url": str(response.url), "truncated": truncated})
+            return page
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, slot: asyncio.Semaphore) -> Optional[Dict]:
+        # Le délai court à partir de l'obtention d'une place sur l'hôte, pas de la mise en attente
+        async with slot:
+            try:
+                page = await asyncio.wait_for(self._download(session, url), self.timeout)
+            except Exception as e:
+                self._count("failed")
+                print(f"⚠️ Page ignorée ({url}) : {str(e) or type(e).__name__}")
+                return None
+
+        self._count("fetched")
+        if page["truncated"]:
+            self._count("truncated")
+        return page
+
+    async def fetch_all(self, urls: List[str]) -> List[Dict]:
+        """
+        Télécharge les pages (URL en double ignorées) et retourne celles lisibles, dans l'ordre des URL
+        """
+        unique_urls = list(dict.fromkeys(urldefrag(url)[0] for url in urls
+                                         if urlparse(url).scheme in ("http", "https")))
+        if not unique_urls:
+            return []
+        host_slots = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=min(self.timeout, 5))
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={"User-Agent": self.user_agent}) as session:
+            pages = await asyncio.gather(*(
+                self._fetch(session, url, host_slots[urlparse(url).netloc]) for url in unique_urls
+            ))
+        return [page for page in pages if page and page["text"]]
+
+    def deduplicate(self, pages: List[Dict]) -> List[Dict]:
+        kept = []
+        signatures = []
+        for page in pages:
+            signature = _shingles(page["text"])
+            duplicate = any(
+                len(signature & other) / len(signature | other) >= self.duplicate_threshold
+                for other in signatures
+            )
+            if duplicate:
+                self._count("duplicates")
+                continue
+            kept.append(page)
+            signatures.append(signature)
+        return kept
+
+    def read_urls(self, urls: List[str], question: str, k: int = 4) -> List[Document]:
+        """
+        Télécharge, nettoie et indexe les pages, puis retourne les k passages les plus proches de la question
+        """
+        pages = self.deduplicate(_run_sync(self.fetch_all(urls)))
+        documents = [
+            Document(page_content=chunk, metadata={"source": page["url"], "title": page["title"]})
+            for page in pages
+            for chunk in self.text_splitter.split_text(page["text"])
+        ]
+        if not documents:
+            return []
+        self._count("chunks", len(documents))
+        # Index éphémère : propre à cette lecture, jamais écrit sur disque
+        vectorstore = FAISS.from_documents(documents, self.embeddings)
+        return vectorstore.similarity_search(question, k=min(k, len(documents)))
+
+
+class WebReaderTool:
+    def __init__(self, search_tool, reader: Optional[WebPageReader] = None, top_n: int = 5, passages: int = 4):
+        """
+        Recherche web + lecture des meilleures pages en un seul appel d'outil
+        """
+        self.search_tool = search_tool
+        self.reader = reader or WebPageReader()
+        self.top_n = top_n
+        self.passages = passages
+
+    def read(self, query: str) -> str:
+        query = query.strip()
+        try:
+            results = self.search_tool.search_results(query, max_results=self.top_n)
+        except Exception as e:
+            return f"Erreur lors des recherches web : {e}"
+
+        urls = [res.get("href", "") for res in results]
+        try:
+            passages = self.reader.read_urls(urls, query, k=self.passages)
+        except Exception as e:
+            return f"Erreur lors de la lecture des pages : {e}"
+        if not passages:
+            return f"❌ Aucune page lisible pour '{query}'."
+
+        output = f"📖 Extraits des pages web pour '{query}' :\n\n"
+        for i, doc in enumerate(passages, 1):
+            title = doc.metadata.get("title") or doc.metadata["source"]
+            output += f"{i}. **{title}**\n{doc.page_content}\n🔗 {doc.metadata['source']}\n\n"
+        return output
+
+    def get_stats(self) -> Dict:
+        with self.reader._stats_lock:
+            return dict(self.reader.stats)
@@ -0,0 +1,106 @@
+# utils/bounded_executor.py
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFullError(Exception):
+    """
+    File d'attente pleine : la requête est refusée immédiatement
+    """
+
+
+class QueueTimeoutError(Exception):
+    """
+    Requête restée trop longtemps en file d'attente : abandonnée avant exécution
+    """
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, queue_timeout: Optional[float] = 30.0,
+                 name: str = "agent-worker"):
+        """
+        Exécute des fonctions bloquantes hors de la boucle asyncio, sur un pool de threads borné.
+        Au plus max_workers tâches s'exécutent et max_queue attendent ; au-delà, refus immédiat.
+        Une tâche qui attend plus de queue_timeout secondes est abandonnée sans être exécutée.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        # Temps d'attente récents (secondes) pour les statistiques
+        self._waits = deque(maxlen=200)
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Exécute func dans le pool sans bloquer la boucle d'événements.
+        Retourne (résultat, temps d'attente en file en secondes).
+        """
+        return await self.submit(func, *args, **kwargs)
+
+    def submit(self, func: Callable, *args, **kwargs) -> "asyncio.Future":
+        """
+        Soumet func au pool (à appeler depuis la boucle d'événements).
+        Le refus (QueueFullError) est immédiat ; le futur donne (résultat, temps d'attente).
+        """
+        with self._lock:
+            # Tâches en cours et en attente confondues : indépendant du démarrage effectif des threads
+            if self._running + self._queued >= self.max_workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise QueueFullError(f"File d'attente pleine ({self._queued}/{self.max_queue})")
+            self._queued += 1
+            self.stats["submitted"] += 1
+        enqueued = time.monotonic()
+
+        def task():
+            wait = time.monotonic() - enqueued
+            with self._lock:
+                self._queued -= 1
+                self._waits.append(wait)
+                if self.queue_timeout is not None and wait > self.queue_timeout:
+                    self.stats["timed_out"] += 1
+                    raise QueueTimeoutError(f"Attente en file trop longue ({wait:.1f} s)")
+                self._running += 1
+            try:
+                result = func(*args, **kwargs)
+                with self._lock:
+                    self.stats["completed"] += 1
+                return result, wait
+            except Exception:
+                with self._lock:
+                    self.stats["failed"] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        return asyncio.wrap_future(self._executor.submit(task))
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._queued
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = dict(self.stats)
+            stats.update({
+                "running": self._running,
+                "queued": self._queued,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "avg_wait_ms": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                "p95_wait_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+                "max_wait_ms": round(1000 * waits[-1], 1) if waits else 0.0
+            })
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,25 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : seuls les verrous entre threads s'appliquent
+    fcntl = None
+
+
+@contextmanager
+def file_lock(lock_file: str, shared: bool = False):
+    """
+    Verrou entre processus (flock) sur un fichier dédié : partagé pour les lectures,
+    exclusif pour les écritures. Non réentrant : ne pas l'imbriquer dans un même thread.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # La fermeture du descripteur libère le verrou
+        os.close(fd)
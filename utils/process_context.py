@@ -0,0 +1,18 @@
+import multiprocessing
+
+# Modules importés une seule fois par le serveur forkserver : ses processus en héritent sans les réimporter
+FORKSERVER_PRELOAD = ["tools.doc_reader", "tools.calculator_worker"]
+
+
+def get_process_context():
+    """
+    Contexte de création des processus de calcul et d'extraction.
+    Ces processus sont lancés depuis les threads d'un serveur (FAISS, SQLite, clients HTTP) :
+    un fork copierait des verrous détenus par d'autres threads et pourrait bloquer l'enfant.
+    forkserver (sinon spawn, ex. Windows) démarre chaque processus depuis un état propre.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        return context
+    return multiprocessing.get_context("spawn")
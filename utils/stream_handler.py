@@ -0,0 +1,61 @@
+# utils/stream_handler.py
+import re
+from typing import Any, Callable, Dict, List
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+
+class AgentEventStreamHandler(BaseCallbackHandler):
+    def __init__(self, emit: Callable[[str, Dict], None], ai_prefix: str = "AI",
+                 max_output_chars: int = 500):
+        """
+        Transmet les étapes de l'agent au fur et à mesure via emit(événement, données) :
+        outil choisi (tool_start), outil terminé (tool_end), puis les jetons de la réponse finale (token).
+        Seuls les jetons qui suivent le préfixe "AI:" du format ReAct sont transmis.
+        """
+        self.emit = emit
+        self.max_output_chars = max_output_chars
+        self._answer_pattern = re.compile(rf"(?:^|\n)\s*{re.escape(ai_prefix)}:")
+        self._buffer = ""
+        self._in_answer = False
+        self._answer_started = False
+
+    def _reset(self):
+        self._buffer = ""
+        self._in_answer = False
+        self._answer_started = False
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any):
+        self._reset()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List, **kwargs: Any):
+        self._reset()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if not self._in_answer:
+            self._buffer += token
+            match = self._answer_pattern.search(self._buffer)
+            if not match:
+                return
+            self._in_answer = True
+            token = self._buffer[match.end():]
+
+        if not self._answer_started:
+            # Espaces entre le préfixe et le début de la réponse
+            token = token.lstrip()
+            if not token:
+                return
+            self._answer_started = True
+        self.emit("token", {"text": token})
+
+    def on_agent_action(self, action, **kwargs: Any):
+        self.emit("tool_start", {"tool": action.tool, "input": action.tool_input})
+
+    def on_tool_end(self, output: Any, **kwargs: Any):
+        output = str(output)
+        if len(output) > self.max_output_chars:
+            output = output[:self.max_output_chars] + "..."
+        self.emit("tool_end", {"tool": kwargs.get("name"), "output": output})
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any):
+        self.emit("tool_error", {"tool": kwargs.get("name"), "error": str(error)})